@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import random
+from datetime import date, timedelta
+from fastapi import FastAPI, HTTPException, Request
+
+
+class FakeBackend:
+    """Stand-in for the BACKEND_URL service with injectable latency and errors."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        gift_cards_per_user: int = 3,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.gift_cards_per_user = gift_cards_per_user
+        # customer telegram_id the next redemption of a shop is for
+        self.customers: dict[int, int] = {}
+        self.shops: dict[int, dict] = {}
+        self._ids = itertools.count(1)
+        self.app = FastAPI()
+        self.app.add_api_route("/giftcards/buy/", self.buy, methods=["POST"])
+        self.app.add_api_route("/giftcards/", self.list_gift_cards, methods=["GET"])
+        self.app.add_api_route(
+            "/giftcards/redeem/", self.redeem, methods=["POST"], status_code=201
+        )
+        self.app.add_api_route(
+            "/giftcards/redeem/", self.update_redeem, methods=["PATCH"]
+        )
+        self.app.add_api_route("/shops/", self.get_shop, methods=["GET"])
+        self.app.add_api_route(
+            "/shops/", self.create_shop, methods=["POST"], status_code=201
+        )
+
+    async def _simulate(self) -> None:
+        if self.latency:
+            # a little jitter so percentiles mean something
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise HTTPException(status_code=503, detail="Injected error")
+
+    @staticmethod
+    def gift_card(code: str, balance: int = 50000) -> dict:
+        return {
+            "code": code,
+            "status": "ACTIVE",
+            "balance": balance,
+            "expires_at": (date.today() + timedelta(days=365)).isoformat(),
+        }
+
+    async def buy(self, request: Request) -> dict:
+        await self._simulate()
+        body = await request.json()
+        return {
+            "payment_link_url": f"https://pay.example.com/{body['user_channel_id']}/{next(self._ids)}"
+        }
+
+    async def list_gift_cards(
+        self, telegram_id: int, limit: int | None = None, cursor: str | None = None
+    ) -> dict:
+        await self._simulate()
+        gift_cards = [
+            self.gift_card(f"GC{telegram_id}X{i}")
+            for i in range(self.gift_cards_per_user)
+        ]
+        start = int(cursor or 0)
+        end = start + limit if limit else len(gift_cards)
+        next_cursor = str(end) if end < len(gift_cards) else None
+        return {"gift_cards": gift_cards[start:end], "next_cursor": next_cursor}
+
+    async def redeem(self, request: Request) -> dict:
+        await self._simulate()
+        body = await request.json()
+        shop_id = int(body["telegram_id"])
+        customer_id = self.customers.get(shop_id, shop_id + 1)
+        return {
+            # the ids travel in the transaction id so update_redeem can answer statelessly
+            "id": f"tx-{customer_id}-{shop_id}-{next(self._ids)}",
+            "customer_telegram_id": str(customer_id),
+            "message": f"Shop wants to redeem {body['gc_code']}. Do you confirm?",
+            "status": "CREATED",
+        }
+
+    async def update_redeem(self, request: Request) -> dict:
+        await self._simulate()
+        body = await request.json()
+        customer_id, shop_id = body["id"].split("-")[1:3]
+        status = "COMPLETED" if body["user_action"] == "redeem_confirm" else "REJECTED"
+        return {
+            "id": body["id"],
+            "customer_telegram_id": customer_id,
+            "shop_telegram_id": shop_id,
+            "message": f"Redemption {status.lower()}",
+            "status": status,
+        }
+
+    async def get_shop(
+        self,
+        telegram_id: int | None = None,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> dict:
+        await self._simulate()
+        if telegram_id is None:
+            # bulk listing for the registry preload
+            shops = list(self.shops.values())
+            start = int(cursor or 0)
+            next_cursor = str(start + limit) if start + limit < len(shops) else None
+            return {"shops": shops[start : start + limit], "next_cursor": next_cursor}
+        if telegram_id not in self.shops:
+            raise HTTPException(status_code=404, detail="Shop not found")
+        return self.shops[telegram_id]
+
+    async def create_shop(self, request: Request) -> dict:
+        await self._simulate()
+        shop = await request.json()
+        self.shops[int(shop["telegram_id"])] = shop
+        return {"shop": shop}
@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Gifty",
+    "username": "gifty_bench_bot",
+}
+
+
+class FakeTelegram:
+    """Stand-in for the Telegram Bot API that records what the bot sends.
+
+    Every chat-level call (sendMessage, editMessageText, ...) is counted per chat
+    so load generators can wait for the bot's answer to reach the "user".
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limit_rate: float = 0.0):
+        self.latency = latency
+        # share of chat-level calls answered with a 429
+        self.rate_limit_rate = rate_limit_rate
+        self.calls: dict[str, int] = defaultdict(int)
+        self._message_ids = itertools.count(1000)
+        self._deliveries: dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.app = FastAPI()
+        self.app.add_api_route(
+            "/bot{token}/{method}", self.handle, methods=["GET", "POST"]
+        )
+
+    async def wait(
+        self, chat_id: int, count: int = 1, timeout: float = 30.0
+    ) -> list[dict]:
+        queue = self._deliveries[chat_id]
+        deliveries = [
+            await asyncio.wait_for(queue.get(), timeout) for _ in range(count)
+        ]
+        if queue.empty():
+            del self._deliveries[chat_id]
+        return deliveries
+
+    @staticmethod
+    async def _params(request: Request) -> dict:
+        body = await request.body()
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("multipart/form-data"):
+            # uploads: only the plain fields matter here
+            params = {}
+            for part in body.split(b"--" + content_type.split("boundary=")[1].encode()):
+                head, _, value = part.partition(b"\r\n\r\n")
+                if b'name="' in head and b"filename=" not in head:
+                    name = head.split(b'name="')[1].split(b'"')[0].decode()
+                    params[name] = value.rstrip(b"\r\n").decode()
+            return params
+        return {}
+
+    def _message(self, params: dict) -> dict:
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(params["chat_id"]), "type": "private"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "photo" in params or "caption" in params:
+            # a photo sent again by file_id keeps it, an upload gets a new one
+            file_id = params.get("photo") or f"photo-{message['message_id']}"
+            message["photo"] = [
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 800,
+                    "height": 500,
+                }
+            ]
+            message["caption"] = params.get("caption", "")
+        return message
+
+    async def handle(self, token: str, method: str, request: Request) -> dict:
+        params = await self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return {"ok": True, "result": BOT_USER}
+        if method == "getUpdates":
+            await asyncio.sleep(1)
+            return {"ok": True, "result": []}
+        if "chat_id" not in params:
+            # answerCallbackQuery, setWebhook, deleteWebhook, ...
+            return {"ok": True, "result": True}
+
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            # the bot library only raises RetryAfter for the HTTP status, not the body
+            return JSONResponse(
+                status_code=429,
+                content={
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+            )
+        chat_id = int(params["chat_id"])
+        result = True if method == "deleteMessage" else self._message(params)
+        self._deliveries[chat_id].put_nowait(
+            {"method": method, "params": params, "at": time.perf_counter()}
+        )
+        return {"ok": True, "result": result}
@@ -0,0 +1,548 @@
+"""Offline load test of the bot against local stand-ins for Telegram and the backend.
+
+    python -m bench.run --flows buy,redeem_listing --iterations 500 --concurrency 50
+
+Every flow is timed from the first request to the moment the fake Telegram receives
+the last message the flow produces, every route in routers/ by its HTTP latency. An
+iteration whose messages aren't the answer the flow expects (method, text, buttons)
+counts as an error.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import tempfile
+import time
+from collections import defaultdict
+import httpx
+import uvicorn
+from bench.fake_backend import FakeBackend
+from bench.fake_telegram import FakeTelegram
+from utils import callbacks, messages
+
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+# shops and customers are paired by a fixed offset of their ids
+SHOP_OFFSET = 500_000_000
+# the language_code of every fake user
+LANGUAGE = "en"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(app, port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+def buttons(params: dict) -> list[dict]:
+    """The inline keyboard buttons of a Bot API call, in order."""
+    markup = params.get("reply_markup")
+    if isinstance(markup, str):
+        markup = json.loads(markup)
+    return [
+        button for row in (markup or {}).get("inline_keyboard", []) for button in row
+    ]
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[tuple[str, str], list[float]] = defaultdict(list)
+        self.errors: dict[tuple[str, str], int] = defaultdict(int)
+        self.elapsed: dict[tuple[str, str], float] = {}
+
+    def report(self) -> list[dict]:
+        rows = []
+        for key in sorted(set(self.latencies) | set(self.errors)):
+            values = self.latencies.get(key, [])
+            elapsed = self.elapsed.get(key)
+            rows.append(
+                {
+                    "kind": key[0],
+                    "name": key[1],
+                    "count": len(values),
+                    "errors": self.errors.get(key, 0),
+                    "throughput": round(len(values) / elapsed, 1) if elapsed else None,
+                    "p50_ms": round(percentile(values, 50) * 1000, 1)
+                    if values
+                    else None,
+                    "p95_ms": round(percentile(values, 95) * 1000, 1)
+                    if values
+                    else None,
+                    "p99_ms": round(percentile(values, 99) * 1000, 1)
+                    if values
+                    else None,
+                }
+            )
+        return rows
+
+
+class Bench:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        telegram: FakeTelegram,
+        backend: FakeBackend,
+        recorder: Recorder,
+        images: bool = False,
+    ):
+        self.client = client
+        self.telegram = telegram
+        self.backend = backend
+        self.recorder = recorder
+        # as an image the gift card is a new message and the payment message loses its button
+        self.payment_deliveries = 2 if images else 1
+        self.card_method = "sendPhoto" if images else "editMessageText"
+        self._update_ids = itertools.count(1)
+
+    async def post(
+        self, path: str, payload, headers: dict | None = None
+    ) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.client.post(path, json=payload, headers=headers)
+        self.recorder.latencies[("route", f"POST {path}")].append(
+            time.perf_counter() - start
+        )
+        response.raise_for_status()
+        return response
+
+    async def expect(
+        self,
+        chat_id: int,
+        method: str,
+        text: str | None = None,
+        button: dict | None = None,
+        count: int = 1,
+    ) -> None:
+        """Waits for count messages to a chat, one of them has to be the expected answer.
+
+        ``text`` is compared with the text (or photo caption), ``button`` has to match
+        the fields it gives of one of the inline buttons.
+        """
+        deliveries = await self.telegram.wait(chat_id, count)
+        for delivery in deliveries:
+            params = delivery["params"]
+            if delivery["method"] != method:
+                continue
+            if text is not None and params.get("text", params.get("caption")) != text:
+                continue
+            if button is not None and not any(
+                all(found.get(field) == value for field, value in button.items())
+                for found in buttons(params)
+            ):
+                continue
+            return
+        sent = [
+            (
+                delivery["method"],
+                delivery["params"].get("text", delivery["params"].get("caption")),
+            )
+            for delivery in deliveries
+        ]
+        raise AssertionError(
+            f"chat {chat_id} expected {method} {text!r} {button or ''}, got {sent}"
+        )
+
+    @staticmethod
+    def user(user_id: int) -> dict:
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": "Bench",
+            "language_code": LANGUAGE,
+        }
+
+    async def callback(self, user_id: int, data: str) -> None:
+        update_id = next(self._update_ids)
+        await self.post(
+            "/telegram/webhook",
+            {
+                "update_id": update_id,
+                "callback_query": {
+                    "id": str(update_id),
+                    "from": self.user(user_id),
+                    "chat_instance": str(user_id),
+                    "data": data,
+                    "message": {
+                        "message_id": 1,
+                        "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"},
+                        "text": "menu",
+                    },
+                },
+            },
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+
+    async def message(self, user_id: int, text: str) -> None:
+        update_id = next(self._update_ids)
+        await self.post(
+            "/telegram/webhook",
+            {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": self.user(user_id),
+                    "text": text,
+                },
+            },
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+
+    def payment(self, user_id: int) -> dict:
+        return {
+            "status": "success",
+            "telegram_id": str(user_id),
+            "message_id": "1",
+            "gift_card": self.backend.gift_card(f"GC{user_id}"),
+        }
+
+    def redeem_event(self, customer_id: int, status: str = "COMPLETED") -> dict:
+        return {
+            "id": f"tx-{customer_id}-{customer_id + SHOP_OFFSET}-{next(self._update_ids)}",
+            "customer_telegram_id": str(customer_id),
+            "shop_telegram_id": str(customer_id + SHOP_OFFSET),
+            "message": f"Redemption {status.lower()}",
+            "status": status,
+        }
+
+    # ---- Flows ----
+
+    async def flow_buy(self, user_id: int) -> None:
+        await self.callback(user_id, callbacks.encode(callbacks.Buy()))
+        await self.expect(
+            user_id,
+            "editMessageText",
+            messages.render("select_amount", LANGUAGE),
+            {"callback_data": callbacks.encode(callbacks.Amount(10000))},
+        )
+        await self.callback(user_id, callbacks.encode(callbacks.Amount(10000)))
+        await self.expect(
+            user_id,
+            "editMessageText",
+            messages.render("pay_prompt", LANGUAGE),
+            {"text": messages.render("button_pay", LANGUAGE)},
+        )
+
+    async def expect_listing(self, user_id: int, code: str, page: int) -> None:
+        await self.expect(
+            user_id,
+            "editMessageText",
+            messages.render("gift_cards_title", LANGUAGE),
+            {"callback_data": callbacks.encode(callbacks.GiftCard(code, page))},
+        )
+
+    async def flow_redeem_listing(self, user_id: int) -> None:
+        await self.callback(user_id, callbacks.encode(callbacks.Redeem()))
+        await self.expect_listing(user_id, f"GC{user_id}X0", 0)
+
+    async def flow_redeem_paging(self, user_id: int) -> None:
+        await self.callback(user_id, callbacks.encode(callbacks.Redeem()))
+        await self.expect_listing(user_id, f"GC{user_id}X0", 0)
+        await self.callback(user_id, callbacks.encode(callbacks.GiftCardPage(1)))
+        await self.expect_listing(user_id, f"GC{user_id}X10", 1)
+        await self.callback(
+            user_id, callbacks.encode(callbacks.GiftCard(f"GC{user_id}X0", 0))
+        )
+        card = self.backend.gift_card(f"GC{user_id}X0")
+        await self.expect(
+            user_id,
+            self.card_method,
+            messages.gift_card("gift_card_details", LANGUAGE, card),
+        )
+
+    async def flow_shop_redemption(self, user_id: int) -> None:
+        shop_id = user_id + SHOP_OFFSET
+        self.backend.customers[shop_id] = user_id
+        shop = self.backend.shops[shop_id] = {
+            "telegram_id": str(shop_id),
+            "name": f"Shop {shop_id}",
+        }
+        # the backend announces the shop, the bot never has to look it up
+        await self.post("/shops/events", {"event": "created", "shop": shop})
+        await self.callback(shop_id, callbacks.encode(callbacks.ShopRedeem()))
+        await self.expect(
+            shop_id, "editMessageText", messages.render("redeem_code_prompt", LANGUAGE)
+        )
+        await self.message(shop_id, f"GC{user_id}X0")
+        await asyncio.gather(
+            self.expect(
+                user_id,
+                "sendMessage",
+                button={"text": messages.render("button_confirm", LANGUAGE)},
+            ),
+            self.expect(
+                shop_id, "sendMessage", messages.render("awaiting_customer", LANGUAGE)
+            ),
+        )
+
+    async def expect_redemption_end(
+        self, customer_id: int, status: str, customer_method: str
+    ) -> None:
+        # the customer gets the menu back, the shop its own
+        await asyncio.gather(
+            self.expect(
+                customer_id,
+                customer_method,
+                f"Redemption {status.lower()}",
+                {"callback_data": callbacks.encode(callbacks.Buy())},
+            ),
+            self.expect(
+                customer_id + SHOP_OFFSET,
+                "sendMessage",
+                f"Redemption {status.lower()}",
+                {"callback_data": callbacks.encode(callbacks.ShopRedeem())},
+            ),
+        )
+
+    async def flow_confirm_reject(self, user_id: int) -> None:
+        transaction_id = (
+            f"tx-{user_id}-{user_id + SHOP_OFFSET}-{next(self._update_ids)}"
+        )
+        action = callbacks.RedeemAction(random.random() < 0.5, transaction_id)
+        await self.callback(user_id, callbacks.encode(action))
+        await self.expect_redemption_end(
+            user_id, "COMPLETED" if action.confirm else "REJECTED", "editMessageText"
+        )
+
+    async def expect_payment(self, user_id: int) -> None:
+        await self.expect(
+            user_id,
+            self.card_method,
+            messages.gift_card(
+                "gift_card_purchased", LANGUAGE, self.backend.gift_card(f"GC{user_id}")
+            ),
+            count=self.payment_deliveries,
+        )
+
+    async def flow_payment_status(self, user_id: int) -> None:
+        await self.post("/payments/status", self.payment(user_id))
+        await self.expect_payment(user_id)
+
+    async def flow_payment_status_batch(self, user_id: int, size: int = 10) -> None:
+        user_ids = [user_id * 100 + i for i in range(size)]
+        await self.post("/payments/status/batch", [self.payment(i) for i in user_ids])
+        await asyncio.gather(*(self.expect_payment(i) for i in user_ids))
+
+    async def flow_redeem_request(self, user_id: int) -> None:
+        await self.post("/giftcards/redeem_request", self.redeem_event(user_id))
+        await self.expect_redemption_end(user_id, "COMPLETED", "sendMessage")
+
+    async def flow_redeem_request_batch(self, user_id: int, size: int = 10) -> None:
+        user_ids = [user_id * 100 + i for i in range(size)]
+        await self.post(
+            "/giftcards/redeem_request/batch", [self.redeem_event(i) for i in user_ids]
+        )
+        await asyncio.gather(
+            *(
+                self.expect_redemption_end(i, "COMPLETED", "sendMessage")
+                for i in user_ids
+            )
+        )
+
+    async def run(
+        self, flow: str, iterations: int, concurrency: int, timeout: float
+    ) -> None:
+        run_once = getattr(self, f"flow_{flow}")
+        semaphore = asyncio.Semaphore(concurrency)
+        # every iteration gets fresh chats so the per-chat limits measure nothing here
+        user_ids = itertools.count(random.randrange(1_000_000, 100_000_000, 1_000_000))
+
+        async def iteration() -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(run_once(next(user_ids)), timeout)
+                except Exception as e:
+                    self.recorder.errors[("flow", flow)] += 1
+                    if self.recorder.errors[("flow", flow)] == 1:
+                        print(f"{flow}: first error: {e!r}")
+                    return
+                self.recorder.latencies[("flow", flow)].append(
+                    time.perf_counter() - start
+                )
+
+        start = time.perf_counter()
+        await asyncio.gather(*(iteration() for _ in range(iterations)))
+        self.recorder.elapsed[("flow", flow)] = time.perf_counter() - start
+
+
+FLOWS = (
+    "buy",
+    "redeem_listing",
+    "redeem_paging",
+    "shop_redemption",
+    "confirm_reject",
+    "payment_status",
+    "payment_status_batch",
+    "redeem_request",
+    "redeem_request_batch",
+)
+
+
+async def main(args: argparse.Namespace) -> list[dict]:
+    telegram = FakeTelegram(
+        latency=args.telegram_latency, rate_limit_rate=args.telegram_429_rate
+    )
+    backend = FakeBackend(
+        latency=args.backend_latency,
+        error_rate=args.backend_error_rate,
+        gift_cards_per_user=args.gift_cards,
+    )
+    telegram_port, backend_port = free_port(), free_port()
+    servers = [
+        await serve(telegram.app, telegram_port),
+        await serve(backend.app, backend_port),
+    ]
+
+    workdir = tempfile.mkdtemp(prefix="gifty-bench-")
+    os.environ.update(
+        {
+            "TELEGRAM_TOKEN": TOKEN,
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{telegram_port}",
+            "BACKEND_URL": f"http://127.0.0.1:{backend_port}",
+            "BOT_MODE": "webhook",
+            "WEBHOOK_URL": "https://bench.invalid/telegram/webhook",
+            "WEBHOOK_SECRET": SECRET,
+            "WORKERS": "1",
+            "PERSISTENCE_PATH": os.path.join(workdir, "bench.sqlite3"),
+            # notifications left by one run must not be delivered by the next
+            "OUTBOX_PATH": os.path.join(workdir, "bench.sqlite3.outbox"),
+            "TRACE_SAMPLE_RATE": "0",
+            "GIFT_CARD_IMAGES": "true" if args.images else "false",
+        }
+    )
+    if not args.real_limits:
+        os.environ.update(
+            {"TELEGRAM_GLOBAL_RATE": "1000000", "TELEGRAM_CHAT_BURST": "1000000"}
+        )
+
+    # imported late: the app reads its settings from the environment at import
+    import main as gifty
+
+    recorder = Recorder()
+    async with gifty.app.router.lifespan_context(gifty.app):
+        transport = httpx.ASGITransport(app=gifty.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://gifty", timeout=60
+        ) as client:
+            bench = Bench(
+                client,
+                telegram,
+                backend,
+                recorder,
+                images=gifty.app.state.telegram_client.cards.enabled,
+            )
+            for flow in args.flows:
+                await bench.run(flow, args.iterations, args.concurrency, args.timeout)
+
+    for server, task in servers:
+        server.should_exit = True
+        await task
+    return recorder.report()
+
+
+def print_report(rows: list[dict]) -> None:
+    columns = (
+        "kind",
+        "name",
+        "count",
+        "errors",
+        "throughput",
+        "p50_ms",
+        "p95_ms",
+        "p99_ms",
+    )
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--flows",
+        type=lambda value: value.split(","),
+        default=list(FLOWS),
+        help=f"comma separated, any of: {', '.join(FLOWS)}",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30.0,
+        help="seconds before an iteration counts as failed",
+    )
+    parser.add_argument(
+        "--backend-latency",
+        type=float,
+        default=0.02,
+        help="mean seconds per backend call",
+    )
+    parser.add_argument(
+        "--backend-error-rate",
+        type=float,
+        default=0.0,
+        help="share of backend calls answered 503",
+    )
+    parser.add_argument(
+        "--gift-cards", type=int, default=25, help="gift cards each fake user owns"
+    )
+    parser.add_argument(
+        "--telegram-latency", type=float, default=0.0, help="seconds per Bot API call"
+    )
+    parser.add_argument(
+        "--telegram-429-rate",
+        type=float,
+        default=0.0,
+        help="share of sends answered 429",
+    )
+    parser.add_argument(
+        "--images",
+        action="store_true",
+        help="deliver gift cards as images (needs pillow, qrcode)",
+    )
+    parser.add_argument(
+        "--real-limits",
+        action="store_true",
+        help="keep Telegram's rate limits in the scheduler",
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    unknown = set(args.flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rows = asyncio.run(main(args))
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(rows, file, indent=2)
@@ -1,22 +1,83 @@
-from fastapi import FastAPI
-from routers import giftcard, payment
-import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from routers import debug, giftcard, payment, shop, telegram
 import uvicorn
+from utils import cluster, metrics, tracing
+from utils.cluster import WORKERS, create_supervisor_app
+from utils.lifecycle import Lifecycle
 from utils.telegram import TelegramClient
+from utils.watchdog import LoopWatchdog
 
-telegram_client = TelegramClient()
-app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = cluster.worker_index()
+    metrics.set_worker(worker)
+    # a single bot runtime per process, shared by the routers and the update handlers
+    telegram_client = TelegramClient(worker)
+    lifecycle = Lifecycle(telegram_client)
+    watchdog = LoopWatchdog()
+    app.state.telegram_client = telegram_client
+    app.state.lifecycle = lifecycle
+    watchdog.start()
+    try:
+        await lifecycle.start()
+        yield
+    finally:
+        try:
+            await lifecycle.drain()
+        finally:
+            await watchdog.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
-# Función para correr FastAPI
-def run_fastapi():
-    uvicorn.run(app, host="0.0.0.0", port=8000)
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    correlation = request.headers.get(tracing.CORRELATION_HEADER)
+    with tracing.start_span(
+        f"{request.method} {request.url.path}", correlation=correlation
+    ) as span:
+        response = await call_next(request)
+        span.set("http.status_code", response.status_code)
+    response.headers[tracing.CORRELATION_HEADER] = correlation or span.trace_id
+    return response
 
-# health check endpoint
+
+# health check endpoints, /health is the readiness check with some detail
 @app.get("/health")
-def healthcheck():
-    return 200
+def healthcheck(request: Request):
+    lifecycle = request.app.state.lifecycle
+    return JSONResponse(
+        {
+            "status": "ok" if lifecycle.ready else lifecycle.phase,
+            "outbound_queue": request.app.state.telegram_client.scheduler.queue_depth,
+            "outbox": len(request.app.state.telegram_client.outbox),
+        },
+        status_code=200 if lifecycle.ready else 503,
+    )
+
+
+@app.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+def readiness(request: Request):
+    lifecycle = request.app.state.lifecycle
+    return JSONResponse(
+        {"status": lifecycle.phase}, status_code=200 if lifecycle.ready else 503
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request):
+    # on the event loop, the thread that records, so the values are never read mid-update
+    metrics.outbound_queue.set(request.app.state.telegram_client.scheduler.queue_depth)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # routes
@@ -28,15 +89,27 @@ app.include_router(
     payment.router,
     prefix="/payments",
 )
+app.include_router(
+    telegram.router,
+    prefix="/telegram",
+)
+app.include_router(
+    shop.router,
+    prefix="/shops",
+)
+app.include_router(
+    debug.router,
+    prefix="/debug",
+)
 
 
 def main():
-    # order matters here. first start fastapi
-    fastapi_thread = threading.Thread(target=run_fastapi, daemon=True)
-    fastapi_thread.start()
-
-    telegram_client = TelegramClient()
-    telegram_client.start()
+    if WORKERS > 1:
+        # the supervisor only routes, the bot runs in each worker process
+        uvicorn.run(create_supervisor_app(WORKERS), host="0.0.0.0", port=8000)
+        return
+    # fastapi and the bot share the same event loop, the bot is started by the lifespan
+    uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
 if __name__ == "__main__":
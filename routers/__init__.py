@@ -1,3 +1,7 @@
 from . import payment
 from . import giftcard
-__all__ = ["payment","giftcard"]
+from . import telegram
+from . import shop
+from . import debug
+
+__all__ = ["payment", "giftcard", "telegram", "shop", "debug"]
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+from secrets import compare_digest
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from utils import profiler
+from utils.profiler import DEBUG_TOKEN
+
+router = APIRouter()
+# one profile at a time, two would sample each other's overhead
+_profiling = asyncio.Lock()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(default=5.0, gt=0, le=60),
+    interval: float = Query(default=0.005, ge=0.001, le=1.0),
+    x_debug_token: str | None = Header(default=None),
+):
+    """Samples the event loop thread and returns folded stacks for a flamegraph."""
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not compare_digest(x_debug_token or "", DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+    if _profiling.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with _profiling:
+        # sampled from another thread while the loop keeps serving
+        stacks = await asyncio.to_thread(
+            profiler.sample, threading.get_ident(), seconds, interval
+        )
+    return PlainTextResponse(stacks)
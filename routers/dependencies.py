@@ -0,0 +1,12 @@
+from fastapi import HTTPException, Request
+from utils.telegram import TelegramClient
+
+
+def get_telegram_client(request: Request) -> TelegramClient:
+    """Returns the bot runtime initialized by the app lifespan, 503 while it is not taking work."""
+    if not request.app.state.lifecycle.accepting:
+        # Telegram and the backend retry, the next instance will take it
+        raise HTTPException(
+            status_code=503, detail="Shutting down", headers={"Retry-After": "1"}
+        )
+    return request.app.state.telegram_client
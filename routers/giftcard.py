@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from schemas.giftcard import RedeemingTransaction
-from utils import telegram
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException
+from routers.dependencies import get_telegram_client
+from schemas.giftcard import RedeemingTransactionUpdate
+from utils import messages, outbox
+from utils.batch import run_batch
+from utils.scheduler import NOTIFICATION
 from utils.telegram import TelegramClient
 
 router = APIRouter()
@@ -9,30 +13,95 @@ router = APIRouter()
 
 @router.post("/redeem_request")
 async def redeem_request(
-    redeeming_transaction: RedeemingTransaction, telegram_client: TelegramClient = Depends()
+    redeeming_transaction: RedeemingTransactionUpdate,
+    telegram_client: TelegramClient = Depends(get_telegram_client),
 ):
+    try:
+        return {
+            "message": await send_redeem_request(telegram_client, redeeming_transaction)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/redeem_request/batch")
+async def redeem_request_batch(
+    redeeming_transactions: list[RedeemingTransactionUpdate],
+    telegram_client: TelegramClient = Depends(get_telegram_client),
+):
+    results = await run_batch(
+        redeeming_transactions,
+        lambda redeeming_transaction: send_redeem_request(
+            telegram_client, redeeming_transaction
+        ),
+    )
+    return {"results": results}
+
+
+async def send_redeem_request(
+    telegram_client: TelegramClient, redeeming_transaction: RedeemingTransactionUpdate
+) -> str:
+    # refused here, once stored they would only fail at delivery
+    for field in ("customer_telegram_id", "shop_telegram_id"):
+        try:
+            int(getattr(redeeming_transaction, field))
+        except ValueError:
+            raise ValueError(
+                f"{field} is not a chat id: {getattr(redeeming_transaction, field)!r}"
+            ) from None
+    # stored before the backend gets its 200, the outbox delivers it from there
+    key = json.dumps(
+        ["redeem_request", redeeming_transaction.id, redeeming_transaction.status]
+    )
+    if await telegram_client.outbox.append(
+        "redeem_request", key, redeeming_transaction
+    ):
+        return f"[{redeeming_transaction.status}] Redeem request queued for the user."
+    return (
+        f"[{redeeming_transaction.status}] Redeem request already queued for the user."
+    )
+
+
+async def deliver_redeem_request(
+    telegram_client: TelegramClient, redeeming_transaction: RedeemingTransactionUpdate
+) -> str:
     transaction_status = redeeming_transaction.status
     message = redeeming_transaction.message
+    customer_id = int(redeeming_transaction.customer_telegram_id)
+    customer_language = await telegram_client.chat_language(customer_id)
+    shop_id = int(redeeming_transaction.shop_telegram_id)
     if transaction_status == "CREATED":
-        await telegram_client.bot_application.bot.send_message(
-            chat_id=int(redeeming_transaction.telegram_id),
+        prompt = await telegram_client.bot_application.bot.send_message(
+            chat_id=customer_id,
             text=message,
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("Confirm", callback_data=f"redeem_confirm__{redeeming_transaction.id}")],
-                [InlineKeyboardButton("Reject", callback_data=f"redeem_reject__{redeeming_transaction.id}")],
-            ])
+            reply_markup=messages.redeem_keyboard(
+                customer_language, redeeming_transaction.id
+            ),
+            rate_limit_args=NOTIFICATION,
         )
-    else:
-        #notifies the customer
-        await telegram_client.bot_application.bot.send_message(
-            chat_id=int(redeeming_transaction.customer_telegram_id),
-            text=message,
-            reply_markup=telegram_client.get_menu()
+        telegram_client.redemptions.prompted(
+            redeeming_transaction.id, customer_id, shop_id, prompt.message_id
         )
-        #notifies the shop
-        await telegram_client.bot_application.bot.send_message(
-            chat_id=int(redeeming_transaction.shop_telegram_id),
-            text=message,
-            reply_markup=telegram_client.get_shop_menu()
+    else:
+        telegram_client.redemptions.finish(redeeming_transaction.id)
+        telegram_client.gift_cards.invalidate(customer_id)
+        shop_language = await telegram_client.chat_language(shop_id)
+        # notifies the customer and the shop
+        await asyncio.gather(
+            telegram_client.bot_application.bot.send_message(
+                chat_id=customer_id,
+                text=message,
+                reply_markup=telegram_client.get_menu(customer_language),
+                rate_limit_args=NOTIFICATION,
+            ),
+            telegram_client.bot_application.bot.send_message(
+                chat_id=shop_id,
+                text=message,
+                reply_markup=telegram_client.get_shop_menu(shop_language),
+                rate_limit_args=NOTIFICATION,
+            ),
         )
-    return {"message": f"[{transaction_status}] Redeem request sent to user."}
+    return f"[{transaction_status}] Redeem request sent to user."
+
+
+outbox.register("redeem_request", RedeemingTransactionUpdate, deliver_redeem_request)
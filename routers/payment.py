@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Depends
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import asyncio
+import json
+from contextlib import suppress
+from fastapi import APIRouter, Depends, HTTPException
+from telegram.error import BadRequest
+from routers.dependencies import get_telegram_client
 from schemas.payment import PaymentStatus
-from utils import telegram
+from utils.batch import run_batch
+from utils import messages, outbox, tracing
+from utils.scheduler import NOTIFICATION
 from utils.telegram import TelegramClient
 
 router = APIRouter()
@@ -9,46 +15,123 @@ router = APIRouter()
 
 @router.post("/status")
 async def payment_status_update(
-    payment: PaymentStatus, telegram_client: TelegramClient = Depends()
+    payment: PaymentStatus,
+    telegram_client: TelegramClient = Depends(get_telegram_client),
 ):
+    try:
+        return {"message": await send_payment_status(telegram_client, payment)}
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/status/batch")
+async def payment_status_batch(
+    payments: list[PaymentStatus],
+    telegram_client: TelegramClient = Depends(get_telegram_client),
+):
+    results = await run_batch(
+        payments, lambda payment: send_payment_status(telegram_client, payment)
+    )
+    return {"results": results}
+
+
+async def send_payment_status(
+    telegram_client: TelegramClient, payment: PaymentStatus
+) -> str:
+    # refused here, once stored it would only fail at delivery
+    try:
+        int(payment.telegram_id)
+    except ValueError:
+        raise ValueError(
+            f"telegram_id is not a chat id: {payment.telegram_id!r}"
+        ) from None
+    # stored before the backend gets its 200, the outbox delivers it from there
+    gift_card = payment.gift_card if isinstance(payment.gift_card, dict) else {}
+    # the backend retries on timeouts, a repeated event must not message the user again
+    key = json.dumps(
+        [
+            "payment",
+            payment.telegram_id,
+            payment.message_id,
+            gift_card.get("code"),
+            payment.status,
+        ]
+    )
+    if await telegram_client.outbox.append("payment_status", key, payment):
+        return "Notification queued for the user."
+    return "Notification already queued for the user."
+
+
+async def deliver_payment_status(
+    telegram_client: TelegramClient, payment: PaymentStatus
+) -> str:
     status = payment.status
     user_id = payment.telegram_id
     message_id = payment.message_id
     giftcard = payment.gift_card
-    gift_card_details = (
-        "🎁 <b>Gift Card Details:</b>\n\n"
-        f"• <b>Code:</b> <code>{giftcard['code']}</code>\n"
-        f"• <b>Status:</b> {giftcard['status']}\n"
-        f"• <b>Balance:</b> {giftcard['balance']} COP\n"
-        f"• <b>Expires At:</b> {giftcard['expires_at']}\n"
-        "\nThank you for your purchase! 🎉"
-    )
-    print(f"[Status]: {status}, [Id]: {user_id}")
+    print(f"[{tracing.correlation_id()}] [Status]: {status}, [Id]: {user_id}")
 
     chat_id = int(user_id)
+    language = await telegram_client.chat_language(chat_id)
     if status == "success":
-        # Build the keyboard
+        telegram_client.gift_cards.invalidate(chat_id)
+    if status == "success" and telegram_client.cards.enabled:
+        # a photo can't replace the text of the payment message, it is sent apart
+        await asyncio.gather(
+            telegram_client.send_gift_card(
+                chat_id,
+                "gift_card_purchased",
+                language,
+                giftcard,
+                rate_limit_args=NOTIFICATION,
+            ),
+            remove_pay_button(telegram_client, chat_id, message_id),
+        )
+    elif status == "success":
+        gift_card_details = messages.gift_card(
+            "gift_card_purchased", language, giftcard
+        )
         try:
             await telegram_client.bot_application.bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=message_id,
                 text=gift_card_details,
-                parse_mode="HTML",
-                reply_markup=telegram_client.get_menu()
+                parse_mode=messages.PARSE_MODE,
+                reply_markup=telegram_client.get_menu(language),
+                rate_limit_args=NOTIFICATION,
             )
-        except telegram.error.BadRequest as e:
-            if "Message to edit not found" in str(e):
+        except BadRequest as e:
+            # a repeated delivery whose edit already went through, anything else lost the message
+            if "message is not modified" not in str(e).lower():
                 # Send a new message if the original message cannot be edited
                 await telegram_client.bot_application.bot.send_message(
                     chat_id=chat_id,
                     text=gift_card_details,
-                    parse_mode="HTML",
-                    reply_markup=telegram_client.get_menu()
+                    parse_mode=messages.PARSE_MODE,
+                    reply_markup=telegram_client.get_menu(language),
+                    rate_limit_args=NOTIFICATION,
                 )
     else:
-        await telegram_client.bot.send_message(
+        await telegram_client.bot_application.bot.send_message(
             chat_id=chat_id,
-            text="❗ Your payment was not successful. Please try again.",
+            text=messages.render("payment_failed", language),
+            parse_mode=messages.PARSE_MODE,
+            rate_limit_args=NOTIFICATION,
         )
 
-    return {"message": "Notification sent to user."}
+    return "Notification sent to user."
+
+
+async def remove_pay_button(
+    telegram_client: TelegramClient, chat_id: int, message_id
+) -> None:
+    with suppress(BadRequest):
+        await telegram_client.bot_application.bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=None,
+            rate_limit_args=NOTIFICATION,
+        )
+
+
+outbox.register("payment_status", PaymentStatus, deliver_payment_status)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+from routers.dependencies import get_telegram_client
+from schemas.shop import ShopEvent
+from utils.telegram import TelegramClient
+
+router = APIRouter()
+
+
+@router.post("/events")
+async def shop_event(
+    event: ShopEvent, telegram_client: TelegramClient = Depends(get_telegram_client)
+):
+    # the backend pushes every change so shop checks never have to ask it
+    telegram_client.shops.apply(event.event, event.shop.model_dump(exclude_none=True))
+    return {"ok": True}
@@ -0,0 +1,22 @@
+from secrets import compare_digest
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from routers.dependencies import get_telegram_client
+from utils.telegram import TelegramClient, WEBHOOK_SECRET
+
+router = APIRouter()
+
+
+@router.post("/webhook")
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: str | None = Header(default=None),
+    telegram_client: TelegramClient = Depends(get_telegram_client),
+):
+    if not WEBHOOK_SECRET or not compare_digest(
+        x_telegram_bot_api_secret_token or "", WEBHOOK_SECRET
+    ):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    # the update is only queued here, the bot processes it concurrently per chat
+    await telegram_client.enqueue_update(await request.json())
+    return {"ok": True}
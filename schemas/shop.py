@@ -0,0 +1,16 @@
+from typing import Literal
+from pydantic import BaseModel
+
+
+class Shop(BaseModel):
+    # a chat id, refused with a 422 rather than failing once stored
+    telegram_id: int
+    name: str | None = None
+    nit: str | None = None
+    email: str | None = None
+    phone: str | None = None
+
+
+class ShopEvent(BaseModel):
+    event: Literal["created", "updated", "deleted"]
+    shop: Shop
@@ -0,0 +1,4 @@
+import os
+
+# the bot's settings are read at import, a test token lets the client be built offline
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:test")
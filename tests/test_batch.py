@@ -0,0 +1,48 @@
+import asyncio
+from utils.batch import run_batch
+
+
+def test_results_keep_the_order_of_the_items():
+    async def send(n):
+        # the first finishes last
+        await asyncio.sleep(0.001 * (3 - n))
+        return f"sent {n}"
+
+    results = asyncio.run(run_batch(range(4), send))
+    assert results == [{"ok": True, "message": f"sent {n}"} for n in range(4)]
+
+
+def test_failing_item_is_reported_alone():
+    async def send(n):
+        if n == 1:
+            raise ValueError("telegram_id is not a chat id: 'x'")
+        return "sent"
+
+    assert asyncio.run(run_batch(range(3), send)) == [
+        {"ok": True, "message": "sent"},
+        {"ok": False, "error": "telegram_id is not a chat id: 'x'"},
+        {"ok": True, "message": "sent"},
+    ]
+
+
+def test_at_most_limit_items_run_at_once():
+    running = peak = 0
+
+    async def send(n):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0)
+        running -= 1
+        return "sent"
+
+    results = asyncio.run(run_batch(range(20), send, limit=3))
+    assert len(results) == 20
+    assert peak == 3
+
+
+def test_empty_batch():
+    async def send(n):
+        raise AssertionError("nothing to send")
+
+    assert asyncio.run(run_batch([], send)) == []
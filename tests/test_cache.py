@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from utils.cache import GiftCardCache
+from utils.resilience import BackendUnavailable
+
+
+class Loader:
+    """Pages of two cards, three pages per user, counts the fetches."""
+
+    def __init__(self):
+        self.calls = []
+        self.down = False
+        self.release: asyncio.Event | None = None
+
+    async def __call__(self, telegram_id: int, cursor: str | None):
+        self.calls.append((telegram_id, cursor))
+        if self.release is not None:
+            await self.release.wait()
+        if self.down:
+            raise BackendUnavailable("list", "open")
+        number = 0 if cursor is None else int(cursor)
+        cards = [{"code": f"{telegram_id}-{number}-{n}"} for n in range(2)]
+        return cards, str(number + 1) if number < 2 else None
+
+
+def codes(page) -> list[str]:
+    return [card["code"] for card in page.gift_cards]
+
+
+def test_pages_follow_the_cursors_and_are_cached():
+    loader = Loader()
+    cache = GiftCardCache(loader)
+
+    async def run():
+        pages = [await cache.page(1, number) for number in range(3)]
+        again = await cache.page(1, 1)
+        return pages, again
+
+    pages, again = asyncio.run(run())
+    assert [number for number, _ in pages] == [0, 1, 2]
+    assert codes(pages[2][1]) == ["1-2-0", "1-2-1"]
+    assert pages[2][1].next_cursor is None
+    assert again == pages[1]
+    assert loader.calls == [(1, None), (1, "1"), (1, "2")]
+
+
+def test_page_with_an_unknown_cursor_falls_back_to_the_first():
+    cache = GiftCardCache(Loader())
+    number, page = asyncio.run(cache.page(1, 4))
+    assert number == 0
+    assert page.cursor is None
+
+
+def test_concurrent_misses_share_one_fetch():
+    loader = Loader()
+    cache = GiftCardCache(loader)
+
+    async def run():
+        loader.release = asyncio.Event()
+        waiting = [asyncio.create_task(cache.page(1)) for _ in range(5)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        return await asyncio.gather(*waiting)
+
+    results = asyncio.run(run())
+    assert len({id(page) for _, page in results}) == 1
+    assert loader.calls == [(1, None)]
+
+
+def test_invalidated_fetch_is_returned_but_not_stored():
+    loader = Loader()
+    cache = GiftCardCache(loader)
+
+    async def run():
+        loader.release = asyncio.Event()
+        waiting = asyncio.create_task(cache.page(1))
+        await asyncio.sleep(0)
+        # a purchase lands while the old list is on its way
+        cache.invalidate(1)
+        loader.release.set()
+        await waiting
+        loader.release = None
+        await cache.page(1)
+
+    asyncio.run(run())
+    assert loader.calls == [(1, None), (1, None)]
+
+
+def test_expired_page_is_served_while_the_backend_is_down():
+    loader = Loader()
+    cache = GiftCardCache(loader, ttl=0)
+
+    async def run():
+        first = await cache.page(1)
+        loader.down = True
+        return first, await cache.page(1)
+
+    first, stale = asyncio.run(run())
+    assert stale == first
+    assert len(loader.calls) == 2
+
+
+def test_backend_down_without_a_page_raises():
+    loader = Loader()
+    loader.down = True
+    with pytest.raises(BackendUnavailable):
+        asyncio.run(GiftCardCache(loader).page(1))
+
+
+def test_least_recent_users_and_pages_are_evicted():
+    loader = Loader()
+    cache = GiftCardCache(loader, max_users=2, max_pages=2)
+
+    async def run():
+        for number in range(3):
+            await cache.page(1, number)
+        # page 0 of user 1 was evicted, its cursor is known anyway
+        await cache.page(1, 0)
+        await cache.page(2)
+        await cache.page(1)
+        await cache.page(3)
+
+    asyncio.run(run())
+    assert len(cache) == 2
+    assert cache.cursor(2, 1) == (False, None)
+    assert cache.cursor(1, 1) == (True, "1")
+    assert loader.calls == [
+        (1, None),
+        (1, "1"),
+        (1, "2"),
+        (1, None),
+        (2, None),
+        (3, None),
+    ]
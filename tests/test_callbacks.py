@@ -0,0 +1,164 @@
+import base64
+import pytest
+from utils import callbacks
+from utils.callbacks import (
+    Amount,
+    Buy,
+    CallbackRouter,
+    GiftCard,
+    GiftCardPage,
+    InvalidCallback,
+    Redeem,
+    RedeemAction,
+    ShopRedeem,
+)
+
+PAYLOADS = [
+    Buy(),
+    Amount(10000),
+    Amount(0),
+    Amount(2**32),
+    Redeem(),
+    GiftCardPage(0),
+    GiftCardPage(300),
+    GiftCard("GC123", 0),
+    GiftCard("GC_WITH_UNDERSCORES_9", 12),
+    GiftCard("código", 1),
+    ShopRedeem(),
+    RedeemAction(True, "tx-1-2-3"),
+    RedeemAction(False, "a" * 30),
+]
+
+
+def pack(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def unpack(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# ---- Codec ----
+
+
+@pytest.mark.parametrize("payload", PAYLOADS, ids=repr)
+def test_round_trip(payload):
+    data = callbacks.encode(payload)
+    assert len(data) <= callbacks.MAX_LENGTH
+    assert callbacks.decode(data) == payload
+    assert type(callbacks.decode(data)) is type(payload)
+
+
+@pytest.mark.parametrize("payload", PAYLOADS, ids=repr)
+def test_truncated_payload_is_malformed(payload):
+    raw = unpack(callbacks.encode(payload))
+    for size in range(1, len(raw)):
+        with pytest.raises(InvalidCallback) as error:
+            callbacks.decode(pack(raw[:size]))
+        assert error.value.reason == "malformed"
+
+
+def test_trailing_bytes_are_malformed():
+    raw = unpack(callbacks.encode(Amount(10000)))
+    with pytest.raises(InvalidCallback) as error:
+        callbacks.decode(pack(raw + b"\x00"))
+    assert error.value.reason == "malformed"
+
+
+def test_bool_out_of_range_is_malformed():
+    raw = bytearray(unpack(callbacks.encode(RedeemAction(True, "tx"))))
+    raw[2] = 2
+    with pytest.raises(InvalidCallback) as error:
+        callbacks.decode(pack(bytes(raw)))
+    assert error.value.reason == "malformed"
+
+
+def test_unknown_tag_and_version_are_stale():
+    for raw in (bytes((callbacks.VERSION, 200)), bytes((callbacks.VERSION + 1, 1))):
+        with pytest.raises(InvalidCallback) as error:
+            callbacks.decode(pack(raw))
+        assert error.value.reason == "stale"
+
+
+@pytest.mark.parametrize("data", ["", "*", "x" * (callbacks.MAX_LENGTH + 1)])
+def test_garbage_is_malformed(data):
+    with pytest.raises(InvalidCallback) as error:
+        callbacks.decode(data)
+    assert error.value.reason == "malformed"
+
+
+def test_encode_refuses_payloads_over_the_limit():
+    with pytest.raises(ValueError):
+        callbacks.encode(GiftCard("C" * callbacks.MAX_LENGTH, 0))
+
+
+def test_encode_refuses_negative_numbers():
+    with pytest.raises(ValueError):
+        callbacks.encode(Amount(-1))
+
+
+# ---- Legacy (version 0) ----
+
+
+@pytest.mark.parametrize(
+    "data, payload",
+    [
+        ("buy", Buy()),
+        ("redeem", Redeem()),
+        ("shop_redeem", ShopRedeem()),
+        ("10000", Amount(10000)),
+        ("gcp_3", GiftCardPage(3)),
+        ("gc_GC123_2", GiftCard("GC123", 2)),
+        # from before pagination, no page
+        ("gc_GC123", GiftCard("GC123", 0)),
+        # codes may have underscores, the page is after the last one
+        ("gc_GC_12_AB_4", GiftCard("GC_12_AB", 4)),
+        ("gc_GC_AB", GiftCard("GC_AB", 0)),
+        ("redeem_confirm__tx-1-2-3", RedeemAction(True, "tx-1-2-3")),
+        ("redeem_reject__tx-1-2-3", RedeemAction(False, "tx-1-2-3")),
+        # the transaction id is everything after the separator
+        ("redeem_confirm__tx__1", RedeemAction(True, "tx__1")),
+    ],
+)
+def test_legacy(data, payload):
+    assert callbacks.decode(data) == payload
+
+
+@pytest.mark.parametrize(
+    "data", ["gcp_", "gcp_x", "redeem_confirm__", "redeem_maybe__tx", "sell"]
+)
+def test_legacy_lookalikes_are_rejected(data):
+    with pytest.raises(InvalidCallback):
+        callbacks.decode(data)
+
+
+# ---- Routing ----
+
+
+def test_router_resolves_by_payload_type():
+    router = CallbackRouter()
+
+    @router(Amount, "amount", check=lambda payload: payload.amount in (10000, 30000))
+    async def amount(payload):
+        pass
+
+    route, payload = router.resolve(callbacks.encode(Amount(30000)))
+    assert route.name == "amount"
+    assert route.handler is amount
+    assert payload == Amount(30000)
+
+
+def test_router_failed_check_is_stale():
+    router = CallbackRouter()
+    router(Amount, "amount", check=lambda payload: payload.amount == 10000)(
+        lambda payload: None
+    )
+    with pytest.raises(InvalidCallback) as error:
+        router.resolve(callbacks.encode(Amount(20000)))
+    assert error.value.reason == "stale"
+
+
+def test_router_without_route_is_stale():
+    with pytest.raises(InvalidCallback) as error:
+        CallbackRouter().resolve(callbacks.encode(Buy()))
+    assert error.value.reason == "stale"
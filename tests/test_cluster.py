@@ -0,0 +1,67 @@
+import multiprocessing
+from collections import Counter
+from utils import cluster
+from utils.cluster import HashRing
+from utils.telegram import TelegramClient
+
+
+def worker_files(index: int, results) -> None:
+    # like a spawned worker: the app's modules are imported (with this module) before
+    # the supervisor's settings are applied
+    cluster.configure_worker(index, 2)
+    client = TelegramClient(cluster.worker_index())
+    results.put((index, client.bot_application.persistence.path, client.outbox.path))
+
+
+def test_workers_get_their_own_files():
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker_files, args=(index, results))
+        for index in range(2)
+    ]
+    for process in processes:
+        process.start()
+    files = dict(
+        (index, paths) for index, *paths in (results.get(timeout=60) for _ in processes)
+    )
+    for process in processes:
+        process.join()
+
+    assert len({path for paths in files.values() for path in paths}) == 4
+    for index, paths in files.items():
+        assert all(path.endswith(f".{index}") for path in paths)
+
+
+def test_single_process_keeps_the_configured_files():
+    assert cluster.worker_path("gifty.sqlite3", None) == "gifty.sqlite3"
+    assert cluster.worker_path("gifty.sqlite3", 3) == "gifty.sqlite3.3"
+
+
+def test_ring_is_stable_and_spreads_chats():
+    ring = HashRing(list(range(4)))
+    assignments = {chat_id: ring.node_for(chat_id) for chat_id in range(10_000)}
+    assert assignments == {
+        chat_id: HashRing(list(range(4))).node_for(chat_id) for chat_id in range(10_000)
+    }
+    counts = Counter(assignments.values())
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 1500
+
+
+def test_ring_moves_only_the_removed_workers_chats():
+    before, after = HashRing([0, 1, 2, 3]), HashRing([0, 1, 2])
+    for chat_id in range(5_000):
+        if before.node_for(chat_id) != 3:
+            assert after.node_for(chat_id) == before.node_for(chat_id)
+
+
+def test_owns_follows_the_ring(monkeypatch):
+    monkeypatch.delenv("CLUSTER_WORKER", raising=False)
+    assert cluster.owns(42)
+    monkeypatch.setenv("CLUSTER_WORKER", "1")
+    monkeypatch.setenv("WORKERS", "3")
+    ring = HashRing([0, 1, 2])
+    assert [cluster.owns(chat_id) for chat_id in range(200)] == [
+        ring.node_for(c) == 1 for c in range(200)
+    ]
@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from utils import telegram
+from utils.lifecycle import STOPPED, Lifecycle
+from utils.telegram import TelegramClient
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(telegram, "PERSISTENCE_PATH", str(tmp_path / "persistence"))
+    monkeypatch.setattr(telegram, "OUTBOX_PATH", str(tmp_path / "outbox"))
+    return TelegramClient()
+
+
+def test_failed_start_stops_what_started_and_keeps_the_error(client, monkeypatch):
+    stopped = []
+
+    async def initialize(bot):
+        raise OSError("no route to Telegram")
+
+    async def closed():
+        stopped.append("backend")
+
+    async def cards_stopped():
+        stopped.append("cards")
+
+    # fails before the bot application runs, stopping it would raise
+    monkeypatch.setattr(type(client.bot_application.bot), "initialize", initialize)
+    monkeypatch.setattr(client.backend, "close", closed)
+    monkeypatch.setattr(client.cards, "stop", cards_stopped)
+    lifecycle = Lifecycle(client, drain_timeout=5)
+
+    async def run():
+        try:
+            await lifecycle.start()
+        finally:
+            # nothing was delivering, there is nothing to wait for
+            await asyncio.wait_for(lifecycle.drain(), 1)
+
+    with pytest.raises(OSError, match="no route to Telegram"):
+        asyncio.run(run())
+    assert stopped == ["backend", "cards"]
+    assert lifecycle.phase == STOPPED
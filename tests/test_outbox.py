@@ -0,0 +1,179 @@
+import asyncio
+import sqlite3
+import pytest
+from pydantic import BaseModel
+from telegram.error import Forbidden, NetworkError
+from utils import cluster, outbox
+from utils.outbox import DELIVERED, FAILED, PENDING, Outbox
+
+
+class Note(BaseModel):
+    n: int
+
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """Registers the "note" kind, returns the notes delivered in order."""
+    notes = []
+
+    async def deliver(context, note):
+        notes.append(note.n)
+
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_BASE", 0.01)
+    monkeypatch.setitem(outbox.HANDLERS, "note", (Note, deliver))
+    return notes
+
+
+def states(path) -> dict[str, tuple[int, int]]:
+    with sqlite3.connect(path) as connection:
+        return {
+            key: (state, attempts)
+            for key, state, attempts in connection.execute(
+                "SELECT key, state, attempts FROM outbox"
+            )
+        }
+
+
+async def append_and_deliver(box: Outbox, entries: dict[str, int]) -> list[bool]:
+    await box.start()
+    stored = await asyncio.gather(
+        *(box.append("note", key, Note(n=n)) for key, n in entries.items())
+    )
+    await box.join()
+    await box.stop()
+    return stored
+
+
+def test_delivers_and_records(tmp_path, delivered):
+    path = tmp_path / "outbox"
+    stored = asyncio.run(append_and_deliver(Outbox(None, str(path)), {"a": 1, "b": 2}))
+    assert stored == [True, True]
+    assert sorted(delivered) == [1, 2]
+    assert states(path) == {"a": (DELIVERED, 1), "b": (DELIVERED, 1)}
+
+
+def test_repeated_key_is_stored_once(tmp_path, delivered):
+    async def run():
+        box = Outbox(None, str(tmp_path / "outbox"))
+        await box.start()
+        first = await box.append("note", "same", Note(n=1))
+        await box.join()
+        again = await box.append("note", "same", Note(n=1))
+        await box.join()
+        await box.stop()
+        return first, again
+
+    assert asyncio.run(run()) == (True, False)
+    assert delivered == [1]
+
+
+def test_pending_entries_survive_a_restart(tmp_path, delivered):
+    path = str(tmp_path / "outbox")
+
+    async def store_without_delivering():
+        box = Outbox(None, path)
+        await box.append("note", "kept", Note(n=7))
+        await box.stop()
+
+    asyncio.run(store_without_delivering())
+    assert delivered == []
+    asyncio.run(append_and_deliver(Outbox(None, path), {}))
+    assert delivered == [7]
+
+
+def test_retries_then_delivers(tmp_path, monkeypatch, delivered):
+    failures = {"flaky": 2}
+
+    async def deliver(context, note):
+        if failures["flaky"]:
+            failures["flaky"] -= 1
+            raise NetworkError("down")
+        delivered.append(note.n)
+
+    monkeypatch.setitem(outbox.HANDLERS, "note", (Note, deliver))
+    path = tmp_path / "outbox"
+
+    async def run():
+        box = Outbox(None, str(path))
+        await box.start()
+        await box.append("note", "flaky", Note(n=1))
+        while len(box):
+            await box.join()
+            await asyncio.sleep(0.01)
+        await box.stop()
+
+    asyncio.run(run())
+    assert delivered == [1]
+    assert states(path) == {"flaky": (DELIVERED, 3)}
+
+
+@pytest.mark.parametrize(
+    "error", [Forbidden("blocked"), ValueError("not a chat id")], ids=repr
+)
+def test_permanent_errors_are_not_retried(tmp_path, monkeypatch, delivered, error):
+    async def deliver(context, note):
+        raise error
+
+    monkeypatch.setitem(outbox.HANDLERS, "note", (Note, deliver))
+    path = tmp_path / "outbox"
+    asyncio.run(append_and_deliver(Outbox(None, str(path)), {"gone": 1}))
+    assert states(path) == {"gone": (FAILED, 1)}
+
+
+def test_slow_delivery_does_not_hold_up_the_others(tmp_path, monkeypatch, delivered):
+    release = None
+
+    async def deliver(context, note):
+        if note.n == 0:
+            # waits for every other entry, a dispatcher waiting on this one would hang
+            await release.wait()
+        delivered.append(note.n)
+        if len(delivered) == 9:
+            release.set()
+
+    monkeypatch.setitem(outbox.HANDLERS, "note", (Note, deliver))
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        await asyncio.wait_for(
+            append_and_deliver(
+                Outbox(None, str(tmp_path / "outbox"), concurrency=3),
+                {str(n): n for n in range(10)},
+            ),
+            5,
+        )
+
+    asyncio.run(run())
+    assert delivered[-1] == 0
+    assert sorted(delivered) == list(range(10))
+
+
+def test_new_file_reclaims_deleted_pages(tmp_path):
+    async def run():
+        box = Outbox(None, str(tmp_path / "outbox"))
+        await box._run(box._connect)
+        await box.stop()
+
+    asyncio.run(run())
+    with sqlite3.connect(tmp_path / "outbox") as connection:
+        # 2 is INCREMENTAL, ignored when set after the switch to WAL
+        assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_workers_keep_separate_outboxes(tmp_path, delivered):
+    path = str(tmp_path / "outbox")
+
+    async def store(worker: int, key: str, n: int):
+        box = Outbox(None, cluster.worker_path(path, worker))
+        await box.append("note", key, Note(n=n))
+        await box.stop()
+
+    asyncio.run(store(0, "zero", 0))
+    asyncio.run(store(1, "one", 1))
+    assert cluster.worker_path(path, 0) != cluster.worker_path(path, 1)
+
+    # each worker only delivers what it stored itself
+    asyncio.run(append_and_deliver(Outbox(None, cluster.worker_path(path, 1)), {}))
+    assert delivered == [1]
+    assert states(cluster.worker_path(path, 0)) == {"zero": (PENDING, 0)}
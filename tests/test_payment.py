@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram.error import BadRequest
+from routers.payment import deliver_payment_status
+from schemas.payment import PaymentStatus
+
+GIFT_CARD = {
+    "code": "GC1",
+    "status": "active",
+    "balance": 100,
+    "expires_at": "2027-01-01",
+}
+
+
+class Bot:
+    def __init__(self, edit_error: str | None):
+        self.edit_error = edit_error
+        self.sent = []
+
+    async def edit_message_text(self, **kwargs):
+        self.sent.append("edit_message_text")
+        if self.edit_error:
+            raise BadRequest(self.edit_error)
+
+    async def send_message(self, **kwargs):
+        self.sent.append("send_message")
+
+
+def deliver(edit_error: str | None) -> list[str]:
+    bot = Bot(edit_error)
+
+    async def chat_language(chat_id):
+        return "en"
+
+    client = SimpleNamespace(
+        bot_application=SimpleNamespace(bot=bot),
+        chat_language=chat_language,
+        gift_cards=SimpleNamespace(invalidate=lambda chat_id: None),
+        cards=SimpleNamespace(enabled=False),
+        get_menu=lambda language: None,
+    )
+    payment = PaymentStatus(
+        status="success", telegram_id="42", gift_card=GIFT_CARD, message_id="7"
+    )
+    asyncio.run(deliver_payment_status(client, payment))
+    return bot.sent
+
+
+@pytest.mark.parametrize(
+    "error, sent",
+    [
+        (None, ["edit_message_text"]),
+        # already edited by an earlier attempt
+        (
+            "Message is not modified: specified new message content is the same",
+            ["edit_message_text"],
+        ),
+        ("Message to edit not found", ["edit_message_text", "send_message"]),
+        ("Message can't be edited", ["edit_message_text", "send_message"]),
+    ],
+)
+def test_success_falls_back_to_a_new_message(error, sent):
+    assert deliver(error) == sent
@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+from utils.persistence import SQLitePersistence
+
+
+def reopen(path) -> SQLitePersistence:
+    return SQLitePersistence(str(path), update_interval=60)
+
+
+def test_data_survives_a_restart(tmp_path):
+    path = tmp_path / "persistence"
+
+    async def write():
+        persistence = reopen(path)
+        await persistence.update_user_data(1, {"language": "es"})
+        await persistence.update_chat_data(2, {"page": 3})
+        await persistence.update_conversation("shop", (1, 1), 2)
+        await persistence.update_conversation("shop", (9, 9), 1)
+        await persistence.update_conversation("shop", (9, 9), None)
+        await persistence.flush()
+
+    async def read():
+        persistence = reopen(path)
+        user_data, chat_data = {}, {}
+        await persistence.refresh_user_data(1, user_data)
+        await persistence.refresh_chat_data(2, chat_data)
+        conversations = await persistence.get_conversations("shop")
+        await persistence.flush()
+        return user_data, chat_data, conversations
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ({"language": "es"}, {"page": 3}, {(1, 1): 2})
+
+
+def test_row_is_loaded_once_and_loses_to_newer_data(tmp_path):
+    path = tmp_path / "persistence"
+
+    async def write():
+        persistence = reopen(path)
+        await persistence.update_user_data(1, {"language": "es", "name": "Ana"})
+        await persistence.flush()
+
+    async def read():
+        persistence = reopen(path)
+        user_data = {"language": "en"}
+        await persistence.refresh_user_data(1, user_data)
+        first = dict(user_data)
+        user_data.clear()
+        # already loaded, the in-memory data is the current one
+        await persistence.refresh_user_data(1, user_data)
+        await persistence.flush()
+        return first, user_data
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ({"language": "en", "name": "Ana"}, {})
+
+
+def test_forgotten_id_is_loaded_again(tmp_path):
+    async def run():
+        persistence = SQLitePersistence(str(tmp_path / "persistence"), max_loaded=1)
+        await persistence.update_user_data(1, {"language": "es"})
+        await persistence.flush()
+        # 2 pushes 1 out of the loaded ids
+        await persistence.refresh_user_data(2, {})
+        user_data = {}
+        await persistence.refresh_user_data(1, user_data)
+        await persistence.flush()
+        return user_data
+
+    assert asyncio.run(run()) == {"language": "es"}
+
+
+def test_user_value_reads_pending_then_stored(tmp_path):
+    async def run():
+        persistence = reopen(tmp_path / "persistence")
+        await persistence.update_user_data(1, {"language": "es"})
+        pending = await persistence.get_user_value(1, "language")
+        await persistence.flush()
+        persistence = reopen(tmp_path / "persistence")
+        stored = await persistence.get_user_value(1, "language")
+        missing = await persistence.get_user_value(2, "language")
+        await persistence.flush()
+        return pending, stored, missing
+
+    assert asyncio.run(run()) == ("es", "es", None)
+
+
+def test_failed_write_is_kept_for_the_next_flush(tmp_path):
+    path = tmp_path / "persistence"
+
+    async def run():
+        persistence = reopen(path)
+        write, failures = (
+            persistence._write,
+            [sqlite3.OperationalError("disk I/O error")],
+        )
+
+        def flaky(pending):
+            if failures:
+                raise failures.pop()
+            write(pending)
+
+        persistence._write = flaky
+        await persistence.update_user_data(1, {"language": "es"})
+        await persistence._flush_task
+        # the next change takes the failed one along
+        await persistence.update_chat_data(2, {"page": 1})
+        await persistence._flush_task
+        left = dict(persistence._pending)
+        await persistence.flush()
+        return left
+
+    assert asyncio.run(run()) == {}
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT user_id, data FROM user_data").fetchall() == [
+            (1, '{"language": "es"}')
+        ]
+        assert connection.execute("SELECT chat_id, data FROM chat_data").fetchall() == [
+            (2, '{"page": 1}')
+        ]
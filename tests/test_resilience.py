@@ -0,0 +1,139 @@
+import asyncio
+from utils.resilience import AdaptiveLimiter, CircuitBreaker
+
+# ---- Circuit breaker ----
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    # a success in between starts the count again
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_lets_a_single_probe_through_after_the_timeout():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=60)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.cancel_probe()
+    assert breaker.allow()
+
+
+def test_late_success_does_not_close_an_open_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    # a call started before the breaker opened
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+# ---- Adaptive limiter ----
+
+
+def calls(limiter: AdaptiveLimiter, latencies, ok: bool = True) -> None:
+    async def run():
+        for latency in latencies:
+            assert await limiter.acquire()
+            limiter.release(latency, ok)
+
+    asyncio.run(run())
+
+
+def test_limit_grows_while_latency_is_usual():
+    limiter = AdaptiveLimiter("test", initial=10, maximum=12)
+    calls(limiter, [0.05] * 10)
+    assert 10.9 < limiter.limit < 11.1
+    calls(limiter, [0.05] * 100)
+    assert limiter.limit == 12
+
+
+def test_failure_cuts_the_limit_once_per_recent_latency():
+    limiter = AdaptiveLimiter("test", initial=10)
+    calls(limiter, [0.05])
+    limiter._last_cut = 0.0
+    # a burst of failures inside one latency window is one cut
+    calls(limiter, [0.05] * 3, ok=False)
+    assert limiter.limit == 10.1 * 0.9
+
+
+def test_congestion_cuts_the_limit_down_to_the_minimum():
+    limiter = AdaptiveLimiter("test", initial=10, minimum=4)
+    calls(limiter, [0.01])
+    for _ in range(20):
+        limiter._last_cut = 0.0
+        calls(limiter, [1.0])
+    assert limiter.limit == 4
+
+
+def test_calls_over_the_limit_wait_in_order():
+    async def run():
+        limiter = AdaptiveLimiter("test", initial=1, queue_timeout=1)
+        order = []
+        assert await limiter.acquire()
+
+        async def call(n):
+            assert await limiter.acquire()
+            order.append(n)
+            limiter.release(0.01, True)
+
+        waiting = [asyncio.create_task(call(n)) for n in range(3)]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1
+        limiter.release(0.01, True)
+        await asyncio.gather(*waiting)
+        return order, limiter.in_flight
+
+    assert asyncio.run(run()) == ([0, 1, 2], 0)
+
+
+def test_call_is_turned_away_after_the_queue_timeout():
+    async def run():
+        limiter = AdaptiveLimiter("test", initial=1, queue_timeout=0.01)
+        await limiter.acquire()
+        return await limiter.acquire(), limiter.in_flight, len(limiter._waiters)
+
+    # the expired waiter stays in the queue until a release skips it
+    assert asyncio.run(run()) == (False, 1, 1)
+
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    async def run():
+        limiter = AdaptiveLimiter("test", initial=1, queue_timeout=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        limiter.abandon()
+        return limiter.in_flight, await limiter.acquire()
+
+    assert asyncio.run(run()) == (0, True)
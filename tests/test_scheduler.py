@@ -0,0 +1,169 @@
+import asyncio
+import pytest
+from telegram.error import RetryAfter
+from utils import scheduler
+from utils.scheduler import NOTIFICATION, OutboundScheduler, TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def fast_chats(monkeypatch):
+    # one message at once per chat, the next one 10ms later
+    monkeypatch.setattr(scheduler, "CHAT_RATE", 100.0)
+    monkeypatch.setattr(scheduler, "CHAT_BURST", 1.0)
+
+
+def send(
+    limiter: OutboundScheduler,
+    sent: list,
+    chat_id,
+    text: str,
+    priority=None,
+    method="sendMessage",
+):
+    async def callback():
+        sent.append(text)
+        return text
+
+    return limiter.process_request(
+        callback, (), {}, method, {"chat_id": chat_id}, priority
+    )
+
+
+async def running(workers: int = 1) -> OutboundScheduler:
+    limiter = OutboundScheduler(workers)
+    await limiter.initialize()
+    return limiter
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = bucket.updated
+    assert bucket.delay(now) == 0
+    bucket.consume()
+    bucket.consume()
+    assert bucket.delay(now) == 0.5
+    assert not bucket.full(now + 0.5)
+    assert bucket.delay(now + 0.5) == 0
+    # never more than the capacity however long it was idle
+    assert bucket.full(now + 60)
+    assert bucket.tokens == 2
+
+
+def test_messages_of_a_chat_keep_their_order():
+    sent = []
+
+    async def run():
+        limiter = await running(workers=4)
+        results = await asyncio.gather(
+            *(send(limiter, sent, 1, str(n)) for n in range(5))
+        )
+        await limiter.shutdown()
+        return results
+
+    assert asyncio.run(run()) == ["0", "1", "2", "3", "4"]
+    assert sent == ["0", "1", "2", "3", "4"]
+
+
+def test_throttled_chat_does_not_hold_up_the_others():
+    sent = []
+
+    async def run():
+        limiter = await running()
+        await asyncio.gather(
+            send(limiter, sent, 1, "first"),
+            send(limiter, sent, 1, "second"),
+            send(limiter, sent, 2, "other"),
+        )
+        await limiter.shutdown()
+
+    asyncio.run(run())
+    # chat 1 has to wait for its bucket before its second message
+    assert sent == ["first", "other", "second"]
+
+
+def test_replies_go_before_notifications():
+    sent = []
+
+    async def run():
+        limiter = await running()
+        release = asyncio.Event()
+
+        async def blocking():
+            await release.wait()
+            sent.append("blocking")
+
+        first = asyncio.create_task(
+            limiter.process_request(
+                blocking, (), {}, "sendMessage", {"chat_id": 0}, None
+            )
+        )
+        await asyncio.sleep(0)
+        # queued while the only worker is busy, the reply was queued last
+        later = [
+            asyncio.create_task(send(limiter, sent, 1, "notification", NOTIFICATION)),
+            asyncio.create_task(send(limiter, sent, 2, "reply")),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *later)
+        await limiter.shutdown()
+
+    asyncio.run(run())
+    assert sent == ["blocking", "reply", "notification"]
+
+
+def test_unlimited_methods_are_not_queued():
+    sent = []
+
+    async def run():
+        limiter = OutboundScheduler()
+        # no workers running, only a call outside the queue can finish
+        result = await asyncio.wait_for(
+            send(limiter, sent, 1, "answered", method="answerCallbackQuery"), 1
+        )
+        return result, limiter.queue_depth
+
+    assert asyncio.run(run()) == ("answered", 0)
+
+
+def test_retry_after_pauses_and_retries():
+    calls = []
+
+    async def flooded():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RetryAfter(0)
+        return "sent"
+
+    async def run():
+        limiter = await running()
+        result = await limiter.process_request(
+            flooded, (), {}, "sendMessage", {"chat_id": 1}, None
+        )
+        await limiter.shutdown()
+        return result
+
+    assert asyncio.run(run()) == "sent"
+    assert calls == [0, 1]
+
+
+def test_discard_pending_cancels_the_queue():
+    sent = []
+
+    async def run():
+        limiter = OutboundScheduler()
+        queued = [
+            asyncio.create_task(send(limiter, sent, chat_id, "never"))
+            for chat_id in range(3)
+        ]
+        await asyncio.sleep(0)
+        depth = limiter.queue_depth
+        discarded = limiter.discard_pending()
+        await asyncio.wait_for(limiter.join(), 1)
+        results = await asyncio.gather(*queued, return_exceptions=True)
+        return depth, discarded, limiter.queue_depth, results
+
+    depth, discarded, left, results = asyncio.run(run())
+    assert (depth, discarded, left) == (3, 3, 0)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert sent == []
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from pydantic import ValidationError
+from schemas.shop import ShopEvent
+from utils.shops import ShopRegistry
+
+
+class Backend:
+    """Knows no shops, counts the lookups that reach it."""
+
+    def __init__(self):
+        self.lookups = 0
+
+    async def get_shop(self, telegram_id):
+        self.lookups += 1
+        return type("Response", (), {"status_code": 404})()
+
+
+def apply(registry: ShopRegistry, payload: dict) -> None:
+    event = ShopEvent.model_validate(payload)
+    registry.apply(event.event, event.shop.model_dump(exclude_none=True))
+
+
+def test_update_keeps_the_fields_it_does_not_carry():
+    registry = ShopRegistry(Backend())
+    apply(
+        registry,
+        {
+            "event": "created",
+            "shop": {"telegram_id": "42", "name": "Old", "email": "a@b.co"},
+        },
+    )
+    apply(registry, {"event": "updated", "shop": {"telegram_id": 42, "name": "New"}})
+    assert asyncio.run(registry.get(42)) == {
+        "telegram_id": 42,
+        "name": "New",
+        "email": "a@b.co",
+    }
+
+
+def test_update_of_an_unknown_shop_adds_it():
+    registry = ShopRegistry(Backend())
+    apply(registry, {"event": "updated", "shop": {"telegram_id": 7, "name": "Shop"}})
+    assert asyncio.run(registry.get(7)) == {"telegram_id": 7, "name": "Shop"}
+
+
+def test_deleted_shop_is_not_looked_up_again():
+    backend = Backend()
+    registry = ShopRegistry(backend)
+    apply(registry, {"event": "created", "shop": {"telegram_id": 42}})
+    apply(registry, {"event": "deleted", "shop": {"telegram_id": 42}})
+
+    async def lookups():
+        return await registry.get(42), await registry.get(42)
+
+    assert asyncio.run(lookups()) == (None, None)
+    assert backend.lookups == 0
+
+
+def test_event_without_a_chat_id_is_refused():
+    with pytest.raises(ValidationError):
+        ShopEvent.model_validate(
+            {"event": "updated", "shop": {"telegram_id": "shop-42"}}
+        )
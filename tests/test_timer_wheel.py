@@ -0,0 +1,110 @@
+import asyncio
+from utils.redemptions import TimerWheel
+
+TICK = 1.0
+
+
+class Clock:
+    """Stands in for the wheel's task: each tick of fake time moves the wheel one slot."""
+
+    def __init__(self, wheel: TimerWheel):
+        self.wheel = wheel
+
+    def advance(self, seconds: float) -> None:
+        for _ in range(round(seconds / self.wheel.tick)):
+            self.wheel._advance()
+
+
+def wheel(slots: int = 8, callback=None) -> tuple[TimerWheel, Clock, list]:
+    fired = []
+    timers = TimerWheel(callback or fired.append, tick=TICK, slots=slots)
+    return timers, Clock(timers), fired
+
+
+def test_timers_fire_on_their_tick_in_order_of_delay():
+    timers, clock, fired = wheel()
+    timers.schedule("late", 5 * TICK)
+    timers.schedule("early", 2 * TICK)
+    clock.advance(TICK)
+    assert fired == []
+    clock.advance(TICK)
+    assert fired == ["early"]
+    clock.advance(3 * TICK)
+    assert fired == ["early", "late"]
+    assert len(timers) == 0
+
+
+def test_delay_is_rounded_up_to_a_whole_tick():
+    timers, clock, fired = wheel()
+    timers.schedule("now", 0)
+    timers.schedule("soon", 1.2 * TICK)
+    clock.advance(TICK)
+    assert fired == ["now"]
+    clock.advance(TICK)
+    assert fired == ["now", "soon"]
+
+
+def test_timer_waits_for_extra_rounds():
+    # longer than two turns of a four slot wheel, it has to skip its slot twice
+    timers, clock, fired = wheel(slots=4)
+    timers.schedule("far", 10 * TICK)
+    clock.advance(9 * TICK)
+    assert fired == []
+    assert len(timers) == 1
+    clock.advance(TICK)
+    assert fired == ["far"]
+    assert len(timers) == 0
+
+
+def test_delay_counts_from_the_current_tick():
+    timers, clock, fired = wheel(slots=4)
+    clock.advance(3 * TICK)
+    timers.schedule("later", 3 * TICK)
+    clock.advance(2 * TICK)
+    assert fired == []
+    clock.advance(TICK)
+    assert fired == ["later"]
+
+
+def test_cancel_and_reschedule():
+    timers, clock, fired = wheel()
+    timers.schedule("cancelled", 2 * TICK)
+    timers.cancel("cancelled")
+    timers.schedule("moved", 2 * TICK)
+    timers.schedule("moved", 30 * TICK)
+    timers.cancel("never scheduled")
+    clock.advance(10 * TICK)
+    assert fired == []
+    assert len(timers) == 1
+    clock.advance(20 * TICK)
+    assert fired == ["moved"]
+
+
+def test_failing_callback_does_not_stop_the_wheel():
+    fired = []
+
+    def callback(key):
+        fired.append(key)
+        if key.startswith("boom"):
+            raise RuntimeError(key)
+
+    timers, clock, _ = wheel(callback=callback)
+    timers.schedule("boom", TICK)
+    # due on the same tick as the failing one
+    timers.schedule("boom too", TICK)
+    timers.schedule("after", 4 * TICK)
+    clock.advance(4 * TICK)
+    assert fired == ["boom", "boom too", "after"]
+
+
+def test_start_and_stop():
+    async def run():
+        timers, _, fired = wheel()
+        timers.schedule("pending", TICK)
+        timers.start()
+        await asyncio.sleep(0)
+        await timers.stop()
+        # stopped before its tick, the timer is still there for the next start
+        return fired, len(timers), timers._task
+
+    assert asyncio.run(run()) == ([], 1, None)
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timezone
+from telegram import Chat, Message, Update
+from utils.updates import ChatOrderedUpdateProcessor
+
+
+def update(update_id: int, chat_id: int) -> Update:
+    message = Message(
+        update_id, datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE)
+    )
+    return Update(update_id, message=message)
+
+
+def test_updates_of_a_chat_run_in_order():
+    done = []
+
+    async def handle(update_id: int, delay: float):
+        await asyncio.sleep(delay)
+        done.append(update_id)
+
+    async def run():
+        processor = ChatOrderedUpdateProcessor(4)
+        # the first is the slowest, the others still wait for it
+        await asyncio.gather(
+            *(
+                processor.process_update(update(n, 1), handle(n, 0.03 - n * 0.01))
+                for n in range(3)
+            )
+        )
+
+    asyncio.run(run())
+    assert done == [0, 1, 2]
+
+
+def test_busy_chat_holds_a_single_slot():
+    done = []
+
+    async def run():
+        processor = ChatOrderedUpdateProcessor(2)
+        release = asyncio.Event()
+
+        async def handle(update_id: int):
+            if update_id < 5:
+                await release.wait()
+            done.append(update_id)
+
+        # five updates of chat 1 are stuck, chat 2 still gets the other slot
+        busy = [
+            asyncio.create_task(processor.process_update(update(n, 1), handle(n)))
+            for n in range(5)
+        ]
+        await asyncio.wait_for(processor.process_update(update(5, 2), handle(5)), 1)
+        release.set()
+        await asyncio.gather(*busy)
+
+    asyncio.run(run())
+    assert done == [5, 0, 1, 2, 3, 4]
+
+
+def test_slots_limit_concurrency_across_chats():
+    running = peak = 0
+
+    async def handle():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run():
+        processor = ChatOrderedUpdateProcessor(3)
+        await asyncio.gather(
+            *(processor.process_update(update(n, n), handle()) for n in range(10))
+        )
+
+    asyncio.run(run())
+    assert peak == 3
+
+
+def test_cancel_pending_closes_waiting_updates():
+    async def run():
+        processor = ChatOrderedUpdateProcessor(1)
+        started = []
+
+        async def handle(update_id: int):
+            started.append(update_id)
+            await asyncio.sleep(10)
+
+        coroutines = [handle(n) for n in range(3)]
+        tasks = [
+            asyncio.create_task(processor.process_update(update(n, 1), c))
+            for n, c in enumerate(coroutines)
+        ]
+        await asyncio.sleep(0.01)
+        cancelled = processor.cancel_pending()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return cancelled, started, processor._chat_locks
+
+    cancelled, started, locks = asyncio.run(run())
+    # only the first ever ran, the others are closed instead of never awaited
+    assert (cancelled, started, locks) == (3, [0], {})
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import time
+import httpx
+from dotenv import load_dotenv
+from utils import metrics, tracing
+from utils.resilience import AdaptiveLimiter, BackendUnavailable, CircuitBreaker
+
+load_dotenv()
+BACKEND_URL = os.getenv("BACKEND_URL")
+BACKEND_HTTP2 = os.getenv("BACKEND_HTTP2", "false").lower() == "true"
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_GET_RETRIES = int(os.getenv("BACKEND_GET_RETRIES", "2"))
+
+# buying creates a payment link with the provider, the rest are plain lookups
+TIMEOUTS = {
+    "buy": httpx.Timeout(15.0, connect=3.0),
+    "redeem": httpx.Timeout(10.0, connect=3.0),
+    "list": httpx.Timeout(5.0, connect=3.0),
+    "shops": httpx.Timeout(5.0, connect=3.0),
+}
+
+
+class BackendClient:
+    """Long lived connection pool for every call to BACKEND_URL."""
+
+    def __init__(self, base_url: str | None = BACKEND_URL):
+        http2 = BACKEND_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print(
+                    "WARNING:  BACKEND_HTTP2 needs httpx[http2], falling back to HTTP/1.1"
+                )
+                http2 = False
+
+        self.client = httpx.AsyncClient(
+            base_url=base_url or "",
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=BACKEND_MAX_CONNECTIONS,
+                max_keepalive_connections=BACKEND_MAX_CONNECTIONS,
+                keepalive_expiry=30.0,
+            ),
+            timeout=httpx.Timeout(10.0, connect=3.0),
+        )
+        self.breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in TIMEOUTS}
+        self.limiters = {endpoint: AdaptiveLimiter(endpoint) for endpoint in TIMEOUTS}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def warm_up(self) -> None:
+        """Opens a pooled connection to the backend, any answer will do."""
+        await self.client.head("/", timeout=TIMEOUTS["list"])
+
+    async def _request(
+        self, endpoint: str, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        breaker, limiter = self.breakers[endpoint], self.limiters[endpoint]
+        # a short wait for a slot, then fail fast instead of piling up behind a slow backend
+        if not await limiter.acquire():
+            raise BackendUnavailable(endpoint, "overloaded")
+        if not breaker.allow():
+            limiter.abandon()
+            raise BackendUnavailable(endpoint, "circuit open")
+
+        start = time.perf_counter()
+        try:
+            response = await self._send(endpoint, method, url, **kwargs)
+        except asyncio.CancelledError:
+            # the caller gave up, that says nothing about the backend
+            limiter.abandon()
+            breaker.cancel_probe()
+            raise
+        except Exception:
+            limiter.release(time.perf_counter() - start, ok=False)
+            breaker.record_failure()
+            raise
+        ok = response.status_code < 500
+        limiter.release(time.perf_counter() - start, ok)
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        return response
+
+    async def _send(
+        self, endpoint: str, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        start = time.perf_counter()
+        with tracing.start_span(
+            f"backend {endpoint}", http_method=method, url=url
+        ) as span:
+            # lets the backend log the same id for this request
+            headers = {
+                tracing.CORRELATION_HEADER: span.trace_id,
+                **kwargs.pop("headers", {}),
+            }
+            try:
+                response = await self.client.request(
+                    method, url, headers=headers, timeout=TIMEOUTS[endpoint], **kwargs
+                )
+            except Exception:
+                metrics.errors.inc("backend")
+                raise
+            finally:
+                metrics.backend_duration.observe(time.perf_counter() - start, endpoint)
+            span.set("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            metrics.errors.inc("backend")
+        return response
+
+    async def _get(self, endpoint: str, url: str, **kwargs) -> httpx.Response:
+        # only GETs are idempotent, so only GETs are retried
+        for attempt in range(BACKEND_GET_RETRIES + 1):
+            last_attempt = attempt == BACKEND_GET_RETRIES
+            try:
+                response = await self._request(endpoint, "GET", url, **kwargs)
+                if response.status_code < 500 or last_attempt:
+                    return response
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+            await asyncio.sleep(0.1 * 2**attempt)
+
+    # ---- Gift cards ----
+
+    async def buy_gift_card(
+        self, amount: int, user_channel_id: str, user_message_id: int
+    ) -> httpx.Response:
+        return await self._request(
+            "buy",
+            "POST",
+            "/giftcards/buy/",
+            json={
+                "amount": amount,
+                "channel": "telegram",
+                "user_channel_id": user_channel_id,
+                "user_message_id": user_message_id,
+            },
+        )
+
+    async def list_gift_cards(
+        self, telegram_id: int, limit: int | None = None, cursor: str | None = None
+    ) -> httpx.Response:
+        params = {"telegram_id": telegram_id}
+        if limit is not None:
+            params["limit"] = limit
+        if cursor is not None:
+            params["cursor"] = cursor
+        return await self._get("list", "/giftcards/", params=params)
+
+    async def redeem_gift_card(self, telegram_id: int, gc_code: str) -> httpx.Response:
+        return await self._request(
+            "redeem",
+            "POST",
+            "/giftcards/redeem/",
+            json={
+                "telegram_id": telegram_id,
+                "gc_code": gc_code,
+            },
+        )
+
+    async def update_redeem(self, id: str, user_action: str) -> httpx.Response:
+        return await self._request(
+            "redeem",
+            "PATCH",
+            "/giftcards/redeem/",
+            json={
+                "id": id,
+                "user_action": user_action,
+            },
+        )
+
+    # ---- Shops ----
+
+    async def get_shop(self, telegram_id: int) -> httpx.Response:
+        return await self._get("shops", "/shops/", params={"telegram_id": telegram_id})
+
+    async def list_shops(self, limit: int, cursor: str | None = None) -> httpx.Response:
+        params = {"limit": limit}
+        if cursor is not None:
+            params["cursor"] = cursor
+        return await self._get("shops", "/shops/", params=params)
+
+    async def create_shop(self, shop_data: dict) -> httpx.Response:
+        return await self._request("shops", "POST", "/shops/", json=shop_data)
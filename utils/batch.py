@@ -0,0 +1,29 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Iterable
+from dotenv import load_dotenv
+
+load_dotenv()
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+
+async def run_batch(
+    items: Iterable[Any],
+    send: Callable[[Any], Awaitable[str]],
+    limit: int = BATCH_CONCURRENCY,
+) -> list[dict]:
+    """Runs send for every item, at most limit at a time, and reports each outcome.
+
+    A failing item is reported in its own result instead of failing the batch.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item: Any) -> dict:
+        async with semaphore:
+            try:
+                return {"ok": True, "message": await send(item)}
+            except Exception as e:
+                print(f"Error in batch item: {e}")
+                return {"ok": False, "error": str(e)}
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
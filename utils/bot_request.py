@@ -0,0 +1,29 @@
+import time
+from telegram.request import HTTPXRequest
+from utils import metrics, tracing
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency and failures of each Bot API method."""
+
+    async def do_request(
+        self, url: str, method: str, *args, **kwargs
+    ) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        with tracing.start_span(f"telegram {api_method}") as span:
+            try:
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+            except Exception:
+                metrics.errors.inc("telegram")
+                raise
+            finally:
+                metrics.telegram_duration.observe(
+                    time.perf_counter() - start, api_method
+                )
+            span.set("http.status_code", code)
+        if code == 429:
+            metrics.telegram_rate_limited.inc(api_method)
+        elif code >= 400:
+            metrics.errors.inc("telegram")
+        return code, payload
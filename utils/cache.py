@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, NamedTuple
+from dotenv import load_dotenv
+from utils.resilience import BackendUnavailable
+
+load_dotenv()
+GIFT_CARD_CACHE_TTL = float(os.getenv("GIFT_CARD_CACHE_TTL", "300"))
+GIFT_CARD_CACHE_SIZE = int(os.getenv("GIFT_CARD_CACHE_SIZE", "10000"))
+# pages kept per user, a user browsing further evicts their least recent page
+GIFT_CARD_CACHE_PAGES = int(os.getenv("GIFT_CARD_CACHE_PAGES", "5"))
+
+
+class Page(NamedTuple):
+    gift_cards: list[dict[str, Any]]
+    # the cursor that loaded this page and the one that loads the next (None on the last)
+    cursor: str | None
+    next_cursor: str | None
+
+
+class GiftCardCache:
+    """Pages of gift cards per telegram_id with a TTL and LRU eviction.
+
+    Pages are numbered from 0 and loaded on demand, the cursor of a page comes from
+    the page before it, so a user holds at most ``max_pages`` pages however many cards
+    they own. Concurrent misses for the same page share one backend fetch. A fetch that
+    was invalidated while in flight is returned to its callers but not stored. While
+    the backend is unavailable an expired page is served rather than nothing.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[
+            [int, str | None], Awaitable[tuple[list[dict[str, Any]], str | None]]
+        ],
+        ttl: float = GIFT_CARD_CACHE_TTL,
+        max_users: int = GIFT_CARD_CACHE_SIZE,
+        max_pages: int = GIFT_CARD_CACHE_PAGES,
+    ):
+        self._loader = loader
+        self._ttl = ttl
+        self._max_users = max_users
+        self._max_pages = max_pages
+        # telegram_id -> page number -> (expires_at, page), oldest use first at both levels
+        self._entries: OrderedDict[int, OrderedDict[int, tuple[float, Page]]] = (
+            OrderedDict()
+        )
+        self._inflight: dict[tuple[int, str | None], asyncio.Task] = {}
+        self._stale: set[tuple[int, str | None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cursor(self, telegram_id: int, number: int) -> tuple[bool, str | None]:
+        """The cursor of a page, if it is known: the page or the one before it is cached."""
+        if number == 0:
+            return True, None
+        pages = self._entries.get(telegram_id, {})
+        if number in pages:
+            return True, pages[number][1].cursor
+        if number - 1 in pages and pages[number - 1][1].next_cursor is not None:
+            return True, pages[number - 1][1].next_cursor
+        return False, None
+
+    async def page(self, telegram_id: int, number: int = 0) -> tuple[int, Page]:
+        """Returns the page and its number, the first page when the cursor is lost."""
+        known, cursor = self.cursor(telegram_id, number)
+        if not known:
+            number = 0
+
+        pages = self._entries.get(telegram_id)
+        entry = pages.get(number) if pages else None
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(telegram_id)
+            pages.move_to_end(number)
+            return number, entry[1]
+
+        key = (telegram_id, cursor)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(
+                self._load(telegram_id, number, cursor)
+            )
+        try:
+            # a caller giving up must not cancel the fetch the others wait for
+            return number, await asyncio.shield(task)
+        except BackendUnavailable:
+            if entry is None:
+                raise
+            return number, entry[1]
+
+    async def _load(self, telegram_id: int, number: int, cursor: str | None) -> Page:
+        key = (telegram_id, cursor)
+        try:
+            gift_cards, next_cursor = await self._loader(telegram_id, cursor)
+            page = Page(gift_cards, cursor, next_cursor)
+            if key not in self._stale:
+                self._store(telegram_id, number, page)
+            return page
+        finally:
+            self._inflight.pop(key, None)
+            self._stale.discard(key)
+
+    def _store(self, telegram_id: int, number: int, page: Page) -> None:
+        pages = self._entries.setdefault(telegram_id, OrderedDict())
+        pages[number] = (time.monotonic() + self._ttl, page)
+        pages.move_to_end(number)
+        while len(pages) > self._max_pages:
+            pages.popitem(last=False)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self._max_users:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._entries.pop(telegram_id, None)
+        for key in self._inflight:
+            if key[0] == telegram_id:
+                self._stale.add(key)
@@ -0,0 +1,230 @@
+import base64
+import binascii
+from typing import Any, Awaitable, Callable, NamedTuple
+
+# first byte of every callback_data, bump it when a payload's fields change
+VERSION = 1
+# Telegram's limit for callback_data
+MAX_LENGTH = 64
+
+
+# ---- Payloads ----
+# fields are encoded in order by their type: int (unsigned varint), bool (one byte),
+# str (varint length + UTF-8)
+
+
+class Buy(NamedTuple):
+    pass
+
+
+class Amount(NamedTuple):
+    amount: int
+
+
+class Redeem(NamedTuple):
+    pass
+
+
+class GiftCardPage(NamedTuple):
+    page: int
+
+
+class GiftCard(NamedTuple):
+    code: str
+    page: int
+
+
+class ShopRedeem(NamedTuple):
+    pass
+
+
+class RedeemAction(NamedTuple):
+    confirm: bool
+    transaction_id: str
+
+    @property
+    def user_action(self) -> str:
+        # the action as the backend names it
+        return "redeem_confirm" if self.confirm else "redeem_reject"
+
+
+Payload = Buy | Amount | Redeem | GiftCardPage | GiftCard | ShopRedeem | RedeemAction
+
+# tag -> payload type, tags are on the wire: never reuse or renumber one
+_TYPES: dict[int, type] = {
+    1: Buy,
+    2: Amount,
+    3: Redeem,
+    4: GiftCardPage,
+    5: GiftCard,
+    6: ShopRedeem,
+    7: RedeemAction,
+}
+_TAGS = {payload_type: tag for tag, payload_type in _TYPES.items()}
+_FIELDS = {
+    payload_type: tuple(getattr(payload_type, "__annotations__", {}).values())
+    for payload_type in _TYPES.values()
+}
+
+
+class InvalidCallback(ValueError):
+    """callback_data that doesn't decode to a payload this version of the bot handles."""
+
+    def __init__(self, reason: str, data: str):
+        super().__init__(f"{reason} callback_data: {data!r}")
+        # "malformed" or "stale", a button from a format or route that no longer exists
+        self.reason = reason
+
+
+# ---- Codec ----
+
+
+def _write_uint(out: bytearray, value: int) -> None:
+    if value < 0:
+        raise ValueError(f"negative value in callback_data: {value}")
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_uint(raw: bytes, position: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = raw[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+        if shift > 35:
+            raise ValueError("varint too long")
+
+
+def encode(payload: Payload) -> str:
+    """Packs a payload into callback_data: version, tag and fields, base64url without padding."""
+    out = bytearray((VERSION, _TAGS[type(payload)]))
+    for kind, value in zip(_FIELDS[type(payload)], payload):
+        if kind is bool:
+            out.append(1 if value else 0)
+        elif kind is int:
+            _write_uint(out, value)
+        else:
+            raw = value.encode()
+            _write_uint(out, len(raw))
+            out += raw
+    data = base64.urlsafe_b64encode(out).rstrip(b"=").decode()
+    if len(data) > MAX_LENGTH:
+        raise ValueError(f"callback_data for {payload!r} is over {MAX_LENGTH} bytes")
+    return data
+
+
+def decode(data: str) -> Payload:
+    """Unpacks callback_data, raises InvalidCallback for anything but a well formed payload."""
+    if not data or len(data) > MAX_LENGTH:
+        raise InvalidCallback("malformed", data)
+    try:
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        raw = b""
+    if len(raw) < 2 or raw[0] != VERSION:
+        payload = _decode_legacy(data)
+        if payload is None:
+            raise InvalidCallback("stale" if len(raw) >= 2 else "malformed", data)
+        return payload
+    payload_type = _TYPES.get(raw[1])
+    if payload_type is None:
+        raise InvalidCallback("stale", data)
+
+    values = []
+    position = 2
+    try:
+        for kind in _FIELDS[payload_type]:
+            if kind is bool:
+                if raw[position] > 1:
+                    raise ValueError("bool out of range")
+                values.append(raw[position] == 1)
+                position += 1
+            elif kind is int:
+                value, position = _read_uint(raw, position)
+                values.append(value)
+            else:
+                size, position = _read_uint(raw, position)
+                if position + size > len(raw):
+                    raise ValueError("string past the end")
+                values.append(raw[position : position + size].decode())
+                position += size
+    except (IndexError, ValueError):
+        # UnicodeDecodeError is a ValueError
+        raise InvalidCallback("malformed", data) from None
+    if position != len(raw):
+        raise InvalidCallback("malformed", data)
+    return payload_type(*values)
+
+
+_LEGACY = {"buy": Buy(), "redeem": Redeem(), "shop_redeem": ShopRedeem()}
+
+
+def _decode_legacy(data: str) -> Payload | None:
+    """Version 0: the plain text callback_data of keyboards sent before this codec.
+
+    Those keyboards stay in the chats, a pending redemption prompt among them.
+    """
+    if data in _LEGACY:
+        return _LEGACY[data]
+    if data.isdigit():
+        return Amount(int(data))
+    action, _, transaction_id = data.partition("__")
+    if action in ("redeem_confirm", "redeem_reject") and transaction_id:
+        return RedeemAction(action == "redeem_confirm", transaction_id)
+    if data.startswith("gcp_") and data[4:].isdigit():
+        return GiftCardPage(int(data[4:]))
+    if data.startswith("gc_"):
+        # gc_{code}_{page}, or gc_{code} from before pagination
+        code, _, page = data[3:].rpartition("_")
+        return (
+            GiftCard(code, int(page))
+            if code and page.isdigit()
+            else GiftCard(data[3:], 0)
+        )
+    return None
+
+
+# ---- Routing ----
+
+
+class Route(NamedTuple):
+    name: str
+    handler: Callable[..., Awaitable[Any]]
+    check: Callable[[Any], bool] | None
+
+
+class CallbackRouter:
+    """Callback query handlers looked up by payload type.
+
+    Handlers register with ``@router(PayloadType, "route_name")``, ``check`` rejects a
+    payload that decodes but can't be served (e.g. an amount no longer sold) before
+    the handler runs.
+    """
+
+    def __init__(self):
+        self._routes: dict[type, Route] = {}
+
+    def __call__(
+        self, payload_type: type, name: str, check: Callable[[Any], bool] | None = None
+    ):
+        def register(handler):
+            self._routes[payload_type] = Route(name, handler, check)
+            return handler
+
+        return register
+
+    def resolve(self, data: str) -> tuple[Route, Payload]:
+        payload = decode(data)
+        route = self._routes.get(type(payload))
+        if route is None:
+            raise InvalidCallback("stale", data)
+        if route.check is not None and not route.check(payload):
+            # well formed, from a keyboard offering something that's gone since
+            raise InvalidCallback("stale", data)
+        return route, payload
@@ -0,0 +1,203 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from dotenv import load_dotenv
+from telegram.error import BadRequest
+from utils import metrics
+
+try:
+    import qrcode
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # optional: poetry install --extras images
+    qrcode = Image = ImageDraw = ImageFont = None
+
+load_dotenv()
+# images need Pillow and qrcode, without them (or with this off) gift cards go out as text
+GIFT_CARD_IMAGES = os.getenv("GIFT_CARD_IMAGES", "true").lower() == "true"
+CARD_RENDER_WORKERS = int(os.getenv("CARD_RENDER_WORKERS", "2"))
+CARD_FILE_ID_CACHE_SIZE = int(os.getenv("CARD_FILE_ID_CACHE_SIZE", "10000"))
+
+# bump when the design changes, file_ids of the old design are not reused
+TEMPLATE_VERSION = 1
+WIDTH, HEIGHT = 800, 500
+QR_SIZE = 300
+BRAND = (93, 63, 211)
+
+
+@lru_cache(maxsize=None)
+def _font(size: int):
+    return ImageFont.load_default(size)
+
+
+@lru_cache(maxsize=None)
+def _template():
+    """The card without its code, drawn once per render process."""
+    card = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    draw = ImageDraw.Draw(card)
+    for y in range(HEIGHT):
+        # brand gradient from top to bottom
+        shade = y / HEIGHT
+        draw.line(
+            [(0, y), (WIDTH, y)],
+            fill=tuple(int(c + (255 - c) * shade * 0.35) for c in BRAND),
+        )
+    draw.rounded_rectangle(
+        [
+            WIDTH - QR_SIZE - 60,
+            (HEIGHT - QR_SIZE) // 2 - 20,
+            WIDTH - 20,
+            (HEIGHT + QR_SIZE) // 2 + 20,
+        ],
+        radius=24,
+        fill="white",
+    )
+    draw.text((40, 40), "gifty", font=_font(64), fill="white")
+    draw.text((40, 120), "GIFT CARD", font=_font(28), fill="white")
+    return card
+
+
+def render_card(code: str, balance: str, expires_at: str) -> bytes:
+    """Renders a gift card as JPEG, runs in the render process pool."""
+    card = _template().copy()
+    draw = ImageDraw.Draw(card)
+    draw.text((40, 230), f"${balance} COP", font=_font(44), fill="white")
+    draw.text((40, 330), code, font=_font(36), fill="white")
+    draw.text((40, 400), str(expires_at), font=_font(24), fill="white")
+
+    # a fixed mask skips scoring all eight, most of the time qrcode spends on a code
+    qr = qrcode.QRCode(
+        border=1, error_correction=qrcode.constants.ERROR_CORRECT_M, mask_pattern=0
+    )
+    qr.add_data(code)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    modules = len(matrix)
+    qr_image = Image.new("L", (modules, modules))
+    qr_image.putdata([0 if dark else 255 for row in matrix for dark in row])
+    # whole pixels per module keep the edges sharp for scanners
+    size = QR_SIZE // modules * modules
+    qr_image = qr_image.resize((size, size), Image.NEAREST)
+    offset = (QR_SIZE - size) // 2
+    card.paste(
+        qr_image, (WIDTH - QR_SIZE - 40 + offset, (HEIGHT - QR_SIZE) // 2 + offset)
+    )
+
+    buffer = io.BytesIO()
+    # Telegram recompresses photos to JPEG anyway, encoding PNG took 10x longer
+    card.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _prepare() -> None:
+    _template()
+
+
+class CardRenderer:
+    """Gift card images rendered in a process pool, uploaded to Telegram once.
+
+    Telegram answers an upload with a file_id that can be sent again without the
+    bytes, so every distinct card (code, balance, expiry) is rendered and uploaded a
+    single time and later sends reuse its file_id. Sends of a card whose upload is in
+    flight wait for that upload instead of starting another one.
+    """
+
+    def __init__(
+        self,
+        workers: int = CARD_RENDER_WORKERS,
+        max_file_ids: int = CARD_FILE_ID_CACHE_SIZE,
+    ):
+        self.enabled = GIFT_CARD_IMAGES and Image is not None and qrcode is not None
+        self._workers = workers
+        self._max_file_ids = max_file_ids
+        self._pool: ProcessPoolExecutor | None = None
+        self._file_ids: OrderedDict[tuple, str] = OrderedDict()
+        self._uploads: dict[tuple, asyncio.Future] = {}
+
+    @staticmethod
+    def key(card: dict) -> tuple:
+        return (
+            TEMPLATE_VERSION,
+            card["code"],
+            str(card["balance"]),
+            str(card["expires_at"]),
+        )
+
+    def start(self) -> None:
+        if GIFT_CARD_IMAGES and not self.enabled:
+            print(
+                "WARNING:  Gift card images need pillow and qrcode, sending gift cards as text"
+            )
+        if self.enabled:
+            # spawned, forking a process with running threads can deadlock the child
+            self._pool = ProcessPoolExecutor(
+                self._workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def warm_up(self) -> None:
+        """Starts the render processes and draws their templates before the first card."""
+        if self._pool is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._pool, _prepare) for _ in range(self._workers))
+        )
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            await asyncio.to_thread(self._pool.shutdown, True, cancel_futures=True)
+            self._pool = None
+
+    async def render(self, card: dict) -> bytes:
+        start = time.perf_counter()
+        jpeg = await asyncio.get_running_loop().run_in_executor(
+            self._pool,
+            render_card,
+            card["code"],
+            str(card["balance"]),
+            str(card["expires_at"]),
+        )
+        metrics.card_render_duration.observe(time.perf_counter() - start)
+        return jpeg
+
+    async def send(self, bot, chat_id: int, card: dict, **kwargs):
+        """Sends the card as a photo, kwargs go to send_photo (caption, reply_markup, ...)."""
+        key = self.key(card)
+        file_id = self._file_ids.get(key)
+        if file_id is None and key in self._uploads:
+            # None when that upload failed, this send then tries its own
+            file_id = await asyncio.shield(self._uploads[key])
+        if file_id is None:
+            return await self._upload(bot, chat_id, card, key, kwargs)
+
+        self._file_ids.move_to_end(key)
+        try:
+            message = await bot.send_photo(chat_id, photo=file_id, **kwargs)
+        except BadRequest:
+            # the file_id is no longer valid, upload the card again
+            self._file_ids.pop(key, None)
+            return await self._upload(bot, chat_id, card, key, kwargs)
+        metrics.card_images.inc("cached")
+        return message
+
+    async def _upload(self, bot, chat_id: int, card: dict, key: tuple, kwargs: dict):
+        upload = self._uploads[key] = asyncio.get_running_loop().create_future()
+        file_id = None
+        try:
+            message = await bot.send_photo(
+                chat_id, photo=await self.render(card), **kwargs
+            )
+            file_id = message.photo[-1].file_id
+        finally:
+            upload.set_result(file_id)
+            if self._uploads.get(key) is upload:
+                del self._uploads[key]
+        self._file_ids[key] = file_id
+        while len(self._file_ids) > self._max_file_ids:
+            self._file_ids.popitem(last=False)
+        metrics.card_images.inc("uploaded")
+        return message
@@ -0,0 +1,376 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from dotenv import load_dotenv
+from utils.lifecycle import DRAIN_TIMEOUT
+
+load_dotenv()
+WORKERS = int(os.getenv("WORKERS", "1"))
+CLUSTER_SOCKET_DIR = os.getenv("CLUSTER_SOCKET_DIR", tempfile.gettempdir())
+
+# backend webhooks -> field holding the chat the notification is about
+SHARD_FIELDS = {
+    "payments/status": "telegram_id",
+    "giftcards/redeem_request": "customer_telegram_id",
+}
+# batch variants take a list of the same payloads and answer {"results": [...]}
+BATCH_SHARD_FIELDS = {
+    "payments/status/batch": "telegram_id",
+    "giftcards/redeem_request/batch": "customer_telegram_id",
+}
+# events every worker has to see, the supervisor sends them to all of them
+BROADCAST_PATHS = {"shops/events"}
+# headers the proxy must not copy between the two connections
+HOP_HEADERS = {
+    "host",
+    "content-length",
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+}
+
+
+class HashRing:
+    """Consistent hash ring, a chat keeps its worker when the ring is rebuilt."""
+
+    def __init__(self, nodes: list[int], replicas: int = 100):
+        self._ring = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [hash_ for hash_, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), "big"
+        )
+
+    def node_for(self, key: object) -> int:
+        index = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+def update_chat_id(update: dict) -> int | None:
+    """Finds the chat of a raw Telegram update without building the objects."""
+    for field, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        if "from" in value:
+            # private chats share the user's id
+            return value["from"].get("id")
+    return None
+
+
+def shard_key(path: str, body: bytes) -> object | None:
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if path == "telegram/webhook":
+        return update_chat_id(payload)
+    field = SHARD_FIELDS.get(path)
+    return payload.get(field) if field else None
+
+
+@lru_cache(maxsize=1)
+def _worker_ring(workers: int) -> HashRing:
+    return HashRing(list(range(workers)))
+
+
+def worker_index() -> int | None:
+    """This process' index in the cluster, None outside cluster mode.
+
+    Read when called: a spawned worker imports main, and every module-level setting
+    with it, before run_worker has set the index.
+    """
+    worker = os.getenv("CLUSTER_WORKER")
+    return None if worker is None else int(worker)
+
+
+def worker_path(path: str, worker: int | None) -> str:
+    """A file of this worker's own, state stays local to the worker that owns the chat."""
+    return path if worker is None else f"{path}.{worker}"
+
+
+def owns(key: object) -> bool:
+    """Whether requests for this chat reach this process, always true outside cluster mode."""
+    worker = worker_index()
+    if worker is None:
+        return True
+    return _worker_ring(int(os.environ["WORKERS"])).node_for(key) == worker
+
+
+def configure_worker(index: int, workers: int) -> None:
+    os.environ["CLUSTER_WORKER"] = str(index)
+    # the supervisor's ring, for owns()
+    os.environ["WORKERS"] = str(workers)
+
+
+def run_worker(index: int, socket_path: str, workers: int) -> None:
+    """Entry point of a worker process: the regular app on a unix socket."""
+    configure_worker(index, workers)
+    import uvicorn
+
+    uvicorn.run("main:app", uds=socket_path, log_level="warning")
+
+
+class Supervisor:
+    """Runs the bot in worker processes and routes requests to them by chat_id."""
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+        self.ring = HashRing(list(range(workers)))
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._clients: dict[int, httpx.AsyncClient] = {}
+        self._monitor: asyncio.Task | None = None
+
+    def socket_path(self, index: int) -> str:
+        return os.path.join(CLUSTER_SOCKET_DIR, f"gifty-{os.getpid()}-{index}.sock")
+
+    def _spawn(self, index: int) -> None:
+        path = self.socket_path(index)
+        if os.path.exists(path):
+            os.remove(path)
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, path, self.workers),
+            name=f"gifty-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def _wait_ready(self, index: int, timeout: float = 30.0) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            try:
+                response = await self._clients[index].get("/health/ready")
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"Worker {index} did not start")
+
+    async def start(self) -> None:
+        for index in range(self.workers):
+            self._clients[index] = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=self.socket_path(index)),
+                base_url="http://worker",
+                timeout=30.0,
+            )
+            self._spawn(index)
+        await asyncio.gather(
+            *(self._wait_ready(index) for index in range(self.workers))
+        )
+        self._monitor = asyncio.create_task(self._supervise())
+        print(f"INFO:     Started {self.workers} gifty workers")
+
+    async def stop(self) -> None:
+        if self._monitor:
+            self._monitor.cancel()
+        for process in self._processes.values():
+            process.terminate()
+        # each worker drains on SIGTERM before it exits
+        for process in self._processes.values():
+            await asyncio.to_thread(process.join, DRAIN_TIMEOUT + 10)
+        for client in self._clients.values():
+            await client.aclose()
+        for index in self._processes:
+            path = self.socket_path(index)
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            for index, process in list(self._processes.items()):
+                if not process.is_alive():
+                    print(
+                        f"WARNING:  Worker {index} exited ({process.exitcode}), restarting"
+                    )
+                    self._spawn(index)
+
+    def worker_for(self, key: object | None, path: str) -> int:
+        return self.ring.node_for(path if key is None else key)
+
+    async def forward(
+        self, index: int, request: Request, path: str, body: bytes
+    ) -> Response:
+        headers = {
+            k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS
+        }
+        response = await self._clients[index].request(
+            request.method,
+            f"/{path}",
+            params=request.query_params,
+            headers=headers,
+            content=body,
+        )
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={
+                k: v
+                for k, v in response.headers.items()
+                if k.lower() not in HOP_HEADERS
+            },
+        )
+
+    async def forward_batch(self, request: Request, path: str, body: bytes) -> Response:
+        """Splits a batch by worker and puts the per-item results back in order."""
+        try:
+            items = json.loads(body)
+        except ValueError:
+            items = None
+        if not isinstance(items, list) or not all(
+            isinstance(item, dict) for item in items
+        ):
+            return await self.forward(self.worker_for(None, path), request, path, body)
+
+        field = BATCH_SHARD_FIELDS[path]
+        positions: dict[int, list[int]] = {}
+        for position, item in enumerate(items):
+            positions.setdefault(self.worker_for(item.get(field), path), []).append(
+                position
+            )
+
+        responses = await asyncio.gather(
+            *(
+                self.forward(
+                    index,
+                    request,
+                    path,
+                    json.dumps([items[p] for p in worker_positions]).encode(),
+                )
+                for index, worker_positions in positions.items()
+            )
+        )
+        results: list[dict | None] = [None] * len(items)
+        for worker_positions, response in zip(positions.values(), responses):
+            if response.status_code != 200:
+                return response
+            for position, result in zip(
+                worker_positions, json.loads(response.body)["results"]
+            ):
+                results[position] = result
+        return JSONResponse({"results": results})
+
+    async def broadcast(self, request: Request, path: str, body: bytes) -> Response:
+        responses = await asyncio.gather(
+            *(self.forward(index, request, path, body) for index in self._clients)
+        )
+        # the backend retries the event unless every worker took it
+        return next(
+            (response for response in responses if response.status_code != 200),
+            responses[0],
+        )
+
+    async def metrics(self) -> str:
+        from utils.metrics import merge
+
+        responses = await asyncio.gather(
+            *(client.get("/metrics", timeout=5.0) for client in self._clients.values()),
+            return_exceptions=True,
+        )
+        return merge(
+            [
+                r.text
+                for r in responses
+                if isinstance(r, httpx.Response) and r.status_code == 200
+            ]
+        )
+
+    async def health(self) -> tuple[bool, list[dict]]:
+        async def check(index: int) -> dict:
+            try:
+                response = await self._clients[index].get("/health", timeout=5.0)
+                return {
+                    "worker": index,
+                    "status_code": response.status_code,
+                    **response.json(),
+                }
+            except Exception as e:
+                return {"worker": index, "status_code": None, "error": str(e)}
+
+        workers = await asyncio.gather(*(check(index) for index in range(self.workers)))
+        return all(worker["status_code"] == 200 for worker in workers), list(workers)
+
+
+def create_supervisor_app(workers: int = WORKERS) -> FastAPI:
+    supervisor = Supervisor(workers)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # imported here so worker processes never load the bot through this module
+        from utils.telegram import BOT_MODE, register_webhook
+
+        if BOT_MODE != "webhook":
+            raise RuntimeError(
+                "WORKERS > 1 needs BOT_MODE=webhook, only one process may poll"
+            )
+        try:
+            await supervisor.start()
+            await register_webhook()
+            yield
+        finally:
+            await supervisor.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.supervisor = supervisor
+
+    @app.get("/health")
+    async def healthcheck():
+        healthy, workers = await supervisor.health()
+        return JSONResponse(
+            {"status": "ok" if healthy else "degraded", "workers": workers},
+            status_code=200 if healthy else 503,
+        )
+
+    @app.get("/health/live")
+    async def liveness():
+        return {"status": "ok"}
+
+    @app.get("/health/ready")
+    async def readiness():
+        healthy, _ = await supervisor.health()
+        return JSONResponse(
+            {"status": "ok" if healthy else "degraded"},
+            status_code=200 if healthy else 503,
+        )
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return PlainTextResponse(
+            await supervisor.metrics(), media_type="text/plain; version=0.0.4"
+        )
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def proxy(path: str, request: Request):
+        body = await request.body()
+        if path in BATCH_SHARD_FIELDS:
+            return await supervisor.forward_batch(request, path, body)
+        if path in BROADCAST_PATHS:
+            return await supervisor.broadcast(request, path, body)
+        index = supervisor.worker_for(shard_key(path, body), path)
+        return await supervisor.forward(index, request, path, body)
+
+    return app
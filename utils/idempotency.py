@@ -0,0 +1,50 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+from dotenv import load_dotenv
+
+load_dotenv()
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+IDEMPOTENCY_SIZE = int(os.getenv("IDEMPOTENCY_SIZE", "50000"))
+
+
+class IdempotencyStore:
+    """Runs an action once per key within a time window.
+
+    Repeats of a finished action get its cached result, repeats of a running one wait
+    for it. Failed actions are forgotten so a retry runs them again. The oldest keys
+    are evicted past ``max_entries``.
+    """
+
+    def __init__(
+        self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_SIZE
+    ):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        # key -> (expires_at, task)
+        self._entries: OrderedDict[Hashable, tuple[float, asyncio.Task]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def run(self, key: Hashable, action: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            return await asyncio.shield(entry[1])
+
+        task = asyncio.ensure_future(action())
+        self._entries[key] = (now + self._ttl, task)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        task.add_done_callback(lambda done: self._forget_failed(key, done))
+        return await asyncio.shield(task)
+
+    def _forget_failed(self, key: Hashable, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is not None:
+            entry = self._entries.get(key)
+            if entry and entry[1] is task:
+                del self._entries[key]
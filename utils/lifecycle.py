@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+# how long shutdown waits for queued updates and messages before dropping them
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+# connections opened to Telegram and to the backend before the app reports ready
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+
+STARTING, WARMING, READY, DRAINING, STOPPED = (
+    "starting",
+    "warming",
+    "ready",
+    "draining",
+    "stopped",
+)
+
+
+class Lifecycle:
+    """Startup, warm-up and drain of the bot runtime, behind the health probes.
+
+    The process is live as soon as it serves HTTP, ready once the bot is started and
+    its connections are open, and stops taking work as soon as it starts draining.
+    """
+
+    def __init__(self, telegram_client, drain_timeout: float = DRAIN_TIMEOUT):
+        self.telegram_client = telegram_client
+        self.drain_timeout = drain_timeout
+        self.phase = STARTING
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == READY
+
+    @property
+    def accepting(self) -> bool:
+        return self.phase == READY
+
+    async def start(self) -> None:
+        await self.telegram_client.start()
+        self.phase = WARMING
+        await asyncio.gather(self.warm_up(), self.telegram_client.shops.preload())
+        self.phase = READY
+
+    async def warm_up(self, connections: int = WARMUP_CONNECTIONS) -> None:
+        # pays for DNS, TCP and TLS now instead of on the first user's request
+        start = time.perf_counter()
+        bot, backend = (
+            self.telegram_client.bot_application.bot,
+            self.telegram_client.backend,
+        )
+        results = await asyncio.gather(
+            *(bot.get_me() for _ in range(connections)),
+            *(backend.warm_up() for _ in range(connections)),
+            self.telegram_client.cards.warm_up(),
+            return_exceptions=True,
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            # not fatal, the pools connect on demand like before
+            print(
+                f"WARNING:  Warm-up: {len(failures)} of {len(results)} connections failed: {failures[0]}"
+            )
+        print(f"INFO:     Warmed up connections in {time.perf_counter() - start:.2f}s")
+
+    async def drain(self) -> None:
+        """Stops intake, lets pending work finish within the deadline, then stops the bot."""
+        self.phase = DRAINING
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.telegram_client.drain(), self.drain_timeout)
+            print(
+                f"INFO:     Drained pending updates and messages in {time.perf_counter() - start:.2f}s"
+            )
+        except asyncio.TimeoutError:
+            updates, messages = self.telegram_client.discard_pending()
+            print(
+                f"WARNING:  Drain deadline of {self.drain_timeout}s reached, "
+                f"dropped {updates} updates and {messages} messages"
+            )
+        finally:
+            await self.telegram_client.stop()
+            self.phase = STOPPED
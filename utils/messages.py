@@ -0,0 +1,317 @@
+import os
+from html import escape
+from string import Formatter
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from dotenv import load_dotenv
+from utils import callbacks
+
+load_dotenv()
+DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "en")
+LANGUAGES = ("en", "es")
+# every catalog message is written for this parse mode, values are escaped for it
+PARSE_MODE = "HTML"
+
+AMOUNTS = (10000, 30000, 50000, 100000)
+
+
+def _plain(value: str) -> str:
+    return value
+
+
+def _html(value: str) -> str:
+    return escape(value, quote=False)
+
+
+class Template:
+    """A message split into literals and fields once, rendered with a single join.
+
+    Values are escaped for PARSE_MODE, button labels are plain text and are not.
+    """
+
+    __slots__ = ("text", "parts", "escape")
+
+    def __init__(self, text: str, plain: bool = False):
+        self.text = text
+        self.parts = tuple(
+            (literal, field) for literal, field, _, _ in Formatter().parse(text)
+        )
+        self.escape = _plain if plain else _html
+
+    def render(self, values: dict) -> str:
+        if len(self.parts) == 1 and self.parts[0][1] is None:
+            return self.text
+        escape_value = self.escape
+        return "".join(
+            literal if field is None else literal + escape_value(str(values[field]))
+            for literal, field in self.parts
+        )
+
+
+_GIFT_CARD = {
+    "en": (
+        "🎁 <b>Gift Card Details:</b>\n\n"
+        "• <b>Code:</b> <code>{code}</code>\n"
+        "• <b>Status:</b> {status}\n"
+        "• <b>Balance:</b> {balance} COP\n"
+        "• <b>Expires At:</b> {expires_at}\n"
+    ),
+    "es": (
+        "🎁 <b>Detalles de la tarjeta de regalo:</b>\n\n"
+        "• <b>Código:</b> <code>{code}</code>\n"
+        "• <b>Estado:</b> {status}\n"
+        "• <b>Saldo:</b> {balance} COP\n"
+        "• <b>Vence:</b> {expires_at}\n"
+    ),
+}
+
+_CATALOG = {
+    "en": {
+        "welcome": "🎁 Hi {name}, welcome to Gifty! ",
+        "select_amount": "Select the amount:",
+        "pay_prompt": "Please complete the payment by clicking 👇:",
+        "no_payment_link": "We could not retrieve the payment link. Please try again.",
+        "purchase_error": "There was an error processing your purchase. Please try again.",
+        "request_error": "An error occurred while processing your request.",
+        "payment_failed": "❗ Your payment was not successful. Please try again.",
+        "gift_cards_title": "Your 🎁<b>Gift Cards</b>👇",
+        "gift_card_button": "Code: {code} - Balance: ${balance}",
+        "no_gift_cards": "You don't have any gift cards to redeem.",
+        "gift_cards_error": "❗ An error occurred while fetching gift cards. Please try again later.",
+        "gift_card_purchased": _GIFT_CARD["en"] + "\nThank you for your purchase! 🎉",
+        "gift_card_details": _GIFT_CARD["en"]
+        + "\n<b>How to redeem?</b>\nProvide the shop the code above to redeem your balance.",
+        "gift_card_not_found": "You have no active gift card matching the code to redeem.",
+        "unknown_action": "You have no active gift cards to redeem.",
+        "unexpected_error": "❗ An unexpected error occurred. Please try again later.",
+        "backend_busy": "⏳ Gifty is very busy right now. Please try again in a minute.",
+        "redeem_code_prompt": "🎁 Insert the gift card code:",
+        "shop_required": "Only registered shops can redeem gift cards. Send /shop to register yours.",
+        "awaiting_customer": "⏳ Awaiting for customer to validate redemption...",
+        "redeem_expired": "⌛ This redemption request expired. Ask the shop to start it again.",
+        "redeem_already_handled": "This redemption request was already answered.",
+        "redemption_error": "An error occurred during redemption. Please try again.",
+        "shop_greeting": "Hi {name}, welcome to Gifty! 🎁",
+        "shop_nit_prompt": "Welcome to the Shop Creator!\n Please provide the shop's NIT:",
+        "shop_name_prompt": "Got it!\n Now, please provide the shop's name:",
+        "shop_email_prompt": "Great!\n Now, please provide the shop's email:",
+        "shop_phone_prompt": "Thanks!\n Now, provide the shop's phone number:",
+        "invalid_email": "Invalid email format. Please try again.",
+        "shop_created": (
+            "🏪      Shop created successfully             ✅\n\n"
+            "• <b>Name</b>: {name}\n"
+            "• <b>Nit</b>: <code>{nit}</code>\n"
+            "• <b>Email</b>: {email}\n"
+            "• <b>Phone</b>: {phone}\n\n\n"
+        ),
+        "shop_error": "Error in shop data:\n{error}\nPlease restart.",
+        "shop_canceled": "Shop creation canceled.",
+        "button_buy": "Buy",
+        "button_redeem": "Redeem",
+        "button_pay": "Pay",
+        "button_confirm": "Confirm",
+        "button_reject": "Reject",
+        "button_previous": "⬅️ Previous",
+        "button_next": "Next ➡️",
+    },
+    "es": {
+        "welcome": "🎁 Hola {name}, ¡bienvenido a Gifty! ",
+        "select_amount": "Selecciona el monto:",
+        "pay_prompt": "Completa el pago haciendo clic 👇:",
+        "no_payment_link": "No pudimos obtener el enlace de pago. Inténtalo de nuevo.",
+        "purchase_error": "Hubo un error procesando tu compra. Inténtalo de nuevo.",
+        "request_error": "Ocurrió un error procesando tu solicitud.",
+        "payment_failed": "❗ Tu pago no fue exitoso. Inténtalo de nuevo.",
+        "gift_cards_title": "Tus 🎁<b>Tarjetas de regalo</b>👇",
+        "gift_card_button": "Código: {code} - Saldo: ${balance}",
+        "no_gift_cards": "No tienes tarjetas de regalo para redimir.",
+        "gift_cards_error": "❗ Ocurrió un error consultando tus tarjetas de regalo. Inténtalo más tarde.",
+        "gift_card_purchased": _GIFT_CARD["es"] + "\n¡Gracias por tu compra! 🎉",
+        "gift_card_details": _GIFT_CARD["es"]
+        + "\n<b>¿Cómo redimir?</b>\nEntrégale al comercio el código de arriba para usar tu saldo.",
+        "gift_card_not_found": "No tienes una tarjeta de regalo activa con ese código.",
+        "unknown_action": "No tienes tarjetas de regalo activas para redimir.",
+        "unexpected_error": "❗ Ocurrió un error inesperado. Inténtalo más tarde.",
+        "backend_busy": "⏳ Gifty está muy ocupado en este momento. Inténtalo de nuevo en un minuto.",
+        "redeem_code_prompt": "🎁 Ingresa el código de la tarjeta de regalo:",
+        "shop_required": "Solo los comercios registrados pueden redimir tarjetas. Envía /shop para registrar el tuyo.",
+        "awaiting_customer": "⏳ Esperando que el cliente valide la redención...",
+        "redeem_expired": "⌛ Esta solicitud de redención expiró. Pide al comercio que la inicie de nuevo.",
+        "redeem_already_handled": "Esta solicitud de redención ya fue respondida.",
+        "redemption_error": "Ocurrió un error durante la redención. Inténtalo de nuevo.",
+        "shop_greeting": "Hola {name}, ¡bienvenido a Gifty! 🎁",
+        "shop_nit_prompt": "¡Bienvenido al creador de comercios!\n Por favor envía el NIT del comercio:",
+        "shop_name_prompt": "¡Listo!\n Ahora envía el nombre del comercio:",
+        "shop_email_prompt": "¡Genial!\n Ahora envía el correo del comercio:",
+        "shop_phone_prompt": "¡Gracias!\n Ahora envía el teléfono del comercio:",
+        "invalid_email": "Formato de correo inválido. Inténtalo de nuevo.",
+        "shop_created": (
+            "🏪      Comercio creado exitosamente             ✅\n\n"
+            "• <b>Nombre</b>: {name}\n"
+            "• <b>Nit</b>: <code>{nit}</code>\n"
+            "• <b>Correo</b>: {email}\n"
+            "• <b>Teléfono</b>: {phone}\n\n\n"
+        ),
+        "shop_error": "Error en los datos del comercio:\n{error}\nPor favor reinicia.",
+        "shop_canceled": "Creación del comercio cancelada.",
+        "button_buy": "Comprar",
+        "button_redeem": "Redimir",
+        "button_pay": "Pagar",
+        "button_confirm": "Confirmar",
+        "button_reject": "Rechazar",
+        "button_previous": "⬅️ Anterior",
+        "button_next": "Siguiente ➡️",
+    },
+}
+
+# compiled once at import
+TEMPLATES = {
+    language: {
+        key: Template(text, plain=key.startswith(("button_", "gift_card_button")))
+        for key, text in messages.items()
+    }
+    for language, messages in _CATALOG.items()
+}
+
+
+def language_for(language_code: str | None) -> str:
+    """Maps a Telegram language_code (e.g. "es-CO") to a catalog language."""
+    if language_code:
+        language = language_code.split("-", 1)[0].lower()
+        if language in TEMPLATES:
+            return language
+    return DEFAULT_LANGUAGE
+
+
+def render(key: str, language: str = DEFAULT_LANGUAGE, **values) -> str:
+    return TEMPLATES.get(language, TEMPLATES[DEFAULT_LANGUAGE])[key].render(values)
+
+
+def gift_card(key: str, language: str, card: dict) -> str:
+    """Renders gift_card_purchased / gift_card_details from a backend gift card."""
+    return render(
+        key,
+        language,
+        code=card["code"],
+        status=card["status"],
+        balance=card["balance"],
+        expires_at=card["expires_at"],
+    )
+
+
+# static keyboards are immutable and shared by every message that shows them
+_MENUS = {
+    language: InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    render("button_buy", language),
+                    callback_data=callbacks.encode(callbacks.Buy()),
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    render("button_redeem", language),
+                    callback_data=callbacks.encode(callbacks.Redeem()),
+                )
+            ],
+        ]
+    )
+    for language in LANGUAGES
+}
+_SHOP_MENUS = {
+    language: InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    render("button_redeem", language),
+                    callback_data=callbacks.encode(callbacks.ShopRedeem()),
+                )
+            ],
+        ]
+    )
+    for language in LANGUAGES
+}
+_AMOUNTS_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton(
+                f"{amount:,}", callback_data=callbacks.encode(callbacks.Amount(amount))
+            )
+        ]
+        for amount in AMOUNTS
+    ]
+)
+
+
+def menu(language: str = DEFAULT_LANGUAGE) -> InlineKeyboardMarkup:
+    return _MENUS.get(language, _MENUS[DEFAULT_LANGUAGE])
+
+
+def shop_menu(language: str = DEFAULT_LANGUAGE) -> InlineKeyboardMarkup:
+    return _SHOP_MENUS.get(language, _SHOP_MENUS[DEFAULT_LANGUAGE])
+
+
+def amounts_keyboard() -> InlineKeyboardMarkup:
+    return _AMOUNTS_KEYBOARD
+
+
+def pay_keyboard(language: str, payment_link: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(render("button_pay", language), url=payment_link)]]
+    )
+
+
+def gift_cards_keyboard(
+    language: str, gift_cards: list[dict], page: int = 0, has_next: bool = False
+) -> InlineKeyboardMarkup:
+    button = TEMPLATES.get(language, TEMPLATES[DEFAULT_LANGUAGE])["gift_card_button"]
+    rows = [
+        [
+            InlineKeyboardButton(
+                button.render(gc),
+                callback_data=callbacks.encode(callbacks.GiftCard(gc["code"], page)),
+            )
+        ]
+        for gc in gift_cards
+    ]
+    navigation = []
+    if page > 0:
+        navigation.append(
+            InlineKeyboardButton(
+                render("button_previous", language),
+                callback_data=callbacks.encode(callbacks.GiftCardPage(page - 1)),
+            )
+        )
+    if has_next:
+        navigation.append(
+            InlineKeyboardButton(
+                render("button_next", language),
+                callback_data=callbacks.encode(callbacks.GiftCardPage(page + 1)),
+            )
+        )
+    if navigation:
+        rows.append(navigation)
+    return InlineKeyboardMarkup(rows)
+
+
+def redeem_keyboard(language: str, transaction_id: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    render("button_confirm", language),
+                    callback_data=callbacks.encode(
+                        callbacks.RedeemAction(True, transaction_id)
+                    ),
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    render("button_reject", language),
+                    callback_data=callbacks.encode(
+                        callbacks.RedeemAction(False, transaction_id)
+                    ),
+                )
+            ],
+        ]
+    )
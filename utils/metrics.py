@@ -0,0 +1,240 @@
+import bisect
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+# added to every series so the supervisor can merge the workers' metrics, see set_worker
+WORKER: int | None = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if WORKER is not None:
+        pairs.append(f'worker="{WORKER}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(ABC):
+    """Base of the in-process metrics, rendered in the Prometheus text format.
+
+    Recording is a dict update on the event loop thread: no locks and no I/O.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """The sample lines, without the HELP and TYPE header."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] += amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = defaultdict(float)
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] += amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] -= amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+
+def set_worker(worker: int | None) -> None:
+    """Labels every series with this cluster worker's index from now on."""
+    global WORKER
+    WORKER = worker
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def merge(expositions: list[str]) -> str:
+    """Merges the output of several processes, keeping one HELP/TYPE per metric."""
+    families: dict[str, list[str]] = {}
+    current = None
+    for text in expositions:
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                current = line.split(" ", 3)[2]
+                if current in families:
+                    continue
+                families[current] = [line]
+            elif line.startswith("# TYPE "):
+                if len(families[current]) == 1:
+                    families[current].append(line)
+            elif line:
+                families[current].append(line)
+    return "\n".join(line for lines in families.values() for line in lines) + "\n"
+
+
+callback_duration = Histogram(
+    "gifty_callback_duration_seconds",
+    "Time spent handling a callback query per route.",
+    ("route",),
+)
+backend_duration = Histogram(
+    "gifty_backend_request_duration_seconds",
+    "Backend request latency per endpoint.",
+    ("endpoint",),
+)
+telegram_duration = Histogram(
+    "gifty_telegram_request_duration_seconds",
+    "Telegram Bot API latency per method.",
+    ("method",),
+)
+errors = Counter("gifty_errors_total", "Errors by where they happened.", ("source",))
+telegram_rate_limited = Counter(
+    "gifty_telegram_rate_limited_total",
+    "Telegram 429 responses per method.",
+    ("method",),
+)
+updates_in_flight = Gauge(
+    "gifty_updates_in_flight", "Updates being processed right now."
+)
+outbound_queue = Gauge(
+    "gifty_outbound_queue_depth", "Messages waiting in the outbound scheduler."
+)
+circuit_state = Gauge(
+    "gifty_backend_circuit_state",
+    "Backend circuit per endpoint: 0 closed, 1 half open, 2 open.",
+    ("endpoint",),
+)
+circuit_transitions = Counter(
+    "gifty_backend_circuit_transitions_total",
+    "Backend circuit state changes.",
+    ("endpoint", "state"),
+)
+concurrency_limit = Gauge(
+    "gifty_backend_concurrency_limit",
+    "Adaptive concurrency limit per backend endpoint.",
+    ("endpoint",),
+)
+loop_lag = Histogram(
+    "gifty_event_loop_lag_seconds",
+    "How late the event loop runs a timer, time spent in other callbacks.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+loop_stalls = Counter(
+    "gifty_event_loop_stalls_total",
+    "Times the event loop was blocked past the stall threshold.",
+)
+shop_lookups = Counter(
+    "gifty_shop_lookups_total",
+    "Shop registry lookups: hit, negative (known not a shop) or miss.",
+    ("result",),
+)
+redemptions = Counter(
+    "gifty_redemptions_total",
+    "Redemption prompts by state reached: pending, done or expired.",
+    ("state",),
+)
+backend_shed = Counter(
+    "gifty_backend_shed_total",
+    "Backend calls rejected by the concurrency limit.",
+    ("endpoint",),
+)
+card_images = Counter(
+    "gifty_card_images_total",
+    "Gift card images sent: cached (file_id reused), uploaded or text fallback.",
+    ("source",),
+)
+card_render_duration = Histogram(
+    "gifty_card_render_duration_seconds", "Time to render a gift card image."
+)
+outbox_pending = Gauge(
+    "gifty_outbox_pending", "Notifications stored in the outbox and not delivered yet."
+)
+outbox_deliveries = Counter(
+    "gifty_outbox_deliveries_total",
+    "Outbox delivery attempts: delivered, retried or failed for good.",
+    ("result",),
+)
+callbacks_rejected = Counter(
+    "gifty_callbacks_rejected_total",
+    "Button taps with callback_data that is malformed or stale.",
+    ("reason",),
+)
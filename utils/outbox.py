@@ -0,0 +1,365 @@
+import asyncio
+import heapq
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import Any, Awaitable, Callable
+from pydantic import BaseModel
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from dotenv import load_dotenv
+from utils import metrics, tracing
+from utils.persistence import PERSISTENCE_PATH
+
+load_dotenv()
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", f"{PERSISTENCE_PATH}.outbox")
+# deliveries in flight at once, each waits only for its own chat
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "50"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "1"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+# delivered entries are kept this long so a notification the backend sends again is recognized
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", "3600"))
+OUTBOX_COMPACT_INTERVAL = float(os.getenv("OUTBOX_COMPACT_INTERVAL", "60"))
+
+PENDING, DELIVERED, FAILED = 0, 1, 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    done_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, done_at);
+"""
+
+# kind -> (schema of the payload, deliver(context, payload)), registered by the routers
+HANDLERS: dict[str, tuple[type[BaseModel], Callable[[Any, Any], Awaitable[Any]]]] = {}
+
+
+def register(
+    kind: str, schema: type[BaseModel], deliver: Callable[[Any, Any], Awaitable[Any]]
+) -> None:
+    HANDLERS[kind] = (schema, deliver)
+
+
+class Outbox:
+    """Durable queue of the notifications the backend hands over for delivery.
+
+    ``append`` returns once the entry is committed to SQLite, appends that arrive while
+    a commit is on disk share the next one (and its fsync). A dispatcher delivers the
+    due entries independently, up to ``OUTBOX_CONCURRENCY`` at once, retries failures
+    with exponential backoff and records the outcomes the same way appends are
+    committed; entries not delivered when the process stops are loaded again at
+    startup, so delivery is at least once. Delivered entries stay for
+    ``OUTBOX_RETENTION`` to recognize repeats by their key, then are compacted away.
+    """
+
+    def __init__(
+        self,
+        context: Any,
+        path: str = OUTBOX_PATH,
+        concurrency: int = OUTBOX_CONCURRENCY,
+    ):
+        # passed to the handlers, the TelegramClient
+        self._context = context
+        self.path = path
+        self._concurrency = concurrency
+        # a single thread owns the connection, which also serializes the writes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._connection: sqlite3.Connection | None = None
+        self._appends: list[
+            tuple[str, str, str, tracing.Span | None, asyncio.Future]
+        ] = []
+        self._commit_task: asyncio.Task | None = None
+        # (due, id, kind, payload, attempts, span of the request that stored it)
+        self._due: list[tuple[float, int, str, str, int, tracing.Span | None]] = []
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._in_flight = 0
+        self._sending: set[asyncio.Task] = set()
+        # (id, state, attempts) of finished deliveries, written to SQLite together
+        self._results: list[tuple[int, int, int]] = []
+        self._record_task: asyncio.Task | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        """Entries not delivered yet, waiting or being sent."""
+        return len(self._due) + self._in_flight
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, fn, *args
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            # lets compaction hand the deleted pages back to the file system, only takes
+            # effect on a new file and so has to come before WAL creates it
+            self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # an acknowledged notification must survive a power loss: fsync every commit
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=FULL")
+            self._connection.executescript(SCHEMA)
+            if self._connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # a file from before the setting, rebuilt once to switch it on
+                self._connection.execute("VACUUM")
+        return self._connection
+
+    # ---- Appending ----
+
+    async def append(self, kind: str, key: str, notification: BaseModel) -> bool:
+        """Stores a notification for delivery, False if one with this key is already stored."""
+        payload = notification.model_dump_json()
+        future = asyncio.get_running_loop().create_future()
+        self._appends.append((key, kind, payload, tracing.current_span(), future))
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.create_task(self._commit())
+        # a caller giving up must not fail the commit the others wait for
+        return await asyncio.shield(future)
+
+    async def _commit(self) -> None:
+        while self._appends:
+            appends, self._appends = self._appends, []
+            try:
+                ids = await self._run(
+                    self._insert,
+                    [(key, kind, payload) for key, kind, payload, *_ in appends],
+                )
+            except Exception as e:
+                print(f"Error writing {len(appends)} entries to the outbox: {e}")
+                for *_, future in appends:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            now = time.monotonic()
+            for (_, kind, payload, span, future), id in zip(appends, ids):
+                if id is not None:
+                    heapq.heappush(self._due, (now, id, kind, payload, 0, span))
+                if not future.done():
+                    future.set_result(id is not None)
+            metrics.outbox_pending.set(len(self))
+            self._idle.clear()
+            self._wakeup.set()
+
+    def _insert(self, rows: list[tuple[str, str, str]]) -> list[int | None]:
+        connection = self._connect()
+        ids = []
+        with connection:
+            for key, kind, payload in rows:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO outbox (key, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (key, kind, payload, time.time()),
+                )
+                ids.append(cursor.lastrowid if cursor.rowcount else None)
+        return ids
+
+    # ---- Dispatching ----
+
+    async def start(self) -> None:
+        def load():
+            return (
+                self._connect()
+                .execute(
+                    "SELECT id, kind, payload, attempts FROM outbox WHERE state = ? ORDER BY id",
+                    (PENDING,),
+                )
+                .fetchall()
+            )
+
+        rows = await self._run(load)
+        now = time.monotonic()
+        self._due = [
+            (now, id, kind, payload, attempts, None)
+            for id, kind, payload, attempts in rows
+        ]
+        heapq.heapify(self._due)
+        metrics.outbox_pending.set(len(self))
+        if rows:
+            print(
+                f"INFO:     Outbox: delivering {len(rows)} notifications left by the previous run"
+            )
+        self._tasks = [
+            asyncio.create_task(self._dispatch()),
+            asyncio.create_task(self._compact()),
+        ]
+
+    async def _dispatch(self) -> None:
+        while True:
+            now = time.monotonic()
+            while (
+                self._due
+                and self._due[0][0] <= now
+                and self._in_flight < self._concurrency
+            ):
+                self._in_flight += 1
+                task = asyncio.create_task(self._send(heapq.heappop(self._due)))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+            due_now = bool(self._due) and self._due[0][0] <= now
+            if not due_now and not self._in_flight and not self._recording():
+                self._idle.set()
+            self._wakeup.clear()
+            # at the cap a finished delivery wakes this up, otherwise the next due entry
+            timeout = self._due[0][0] - now if self._due and not due_now else None
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    async def _send(self, entry: tuple) -> None:
+        try:
+            result = await self._deliver(*entry[1:])
+        finally:
+            self._in_flight -= 1
+        self._results.append(result)
+        if self._record_task is None or self._record_task.done():
+            self._record_task = asyncio.create_task(self._record_results())
+        self._wakeup.set()
+
+    def _recording(self) -> bool:
+        return bool(self._results) or (
+            self._record_task is not None and not self._record_task.done()
+        )
+
+    async def _record_results(self) -> None:
+        while self._results:
+            results, self._results = self._results, []
+            try:
+                await self._run(self._record, results)
+            except Exception as e:
+                # the entries are retried after a restart, delivered ones may go out twice
+                print(f"Error recording outbox deliveries: {e}")
+        metrics.outbox_pending.set(len(self))
+        self._wakeup.set()
+
+    async def _deliver(
+        self,
+        id: int,
+        kind: str,
+        payload: str,
+        attempts: int,
+        parent: tracing.Span | None,
+    ) -> tuple[int, int, int]:
+        attempts += 1
+        try:
+            schema, deliver = HANDLERS[kind]
+            with tracing.start_span(
+                "outbox", parent=parent, kind=kind, attempt=attempts
+            ):
+                await deliver(self._context, schema.model_validate_json(payload))
+        except (BadRequest, Forbidden, ValueError) as e:
+            # the chat is gone, the bot is blocked or the payload doesn't validate (pydantic's
+            # ValidationError is a ValueError), retrying won't change that
+            print(f"Outbox entry {id} ({kind}) can't be delivered: {e}")
+            metrics.outbox_deliveries.inc("failed")
+            return id, FAILED, attempts
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # the message was dropped from the send queue, not this delivery cancelled
+            return self._retry(
+                id, kind, payload, attempts, parent, "dropped from the send queue"
+            )
+        except Exception as e:
+            return self._retry(id, kind, payload, attempts, parent, e)
+        metrics.outbox_deliveries.inc("delivered")
+        return id, DELIVERED, attempts
+
+    def _retry(
+        self,
+        id: int,
+        kind: str,
+        payload: str,
+        attempts: int,
+        parent: tracing.Span | None,
+        error,
+    ) -> tuple[int, int, int]:
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            print(
+                f"Outbox entry {id} ({kind}) failed {attempts} times, giving up: {error!r}"
+            )
+            metrics.outbox_deliveries.inc("failed")
+            return id, FAILED, attempts
+        if isinstance(error, RetryAfter):
+            delay = error.retry_after
+        else:
+            # jittered so entries failing together don't all come back together
+            delay = min(
+                OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (attempts - 1)
+            ) * random.uniform(0.5, 1)
+        heapq.heappush(
+            self._due, (time.monotonic() + delay, id, kind, payload, attempts, parent)
+        )
+        print(
+            f"Outbox entry {id} ({kind}) failed, retry {attempts} in {delay:.1f}s: {error!r}"
+        )
+        metrics.outbox_deliveries.inc("retried")
+        return id, PENDING, attempts
+
+    def _record(self, results: list[tuple[int, int, int]]) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE outbox SET state = ?, attempts = ?, done_at = ? WHERE id = ?",
+                [
+                    (state, attempts, None if state == PENDING else now, id)
+                    for id, state, attempts in results
+                ],
+            )
+
+    async def _compact(self) -> None:
+        def compact() -> int:
+            connection = self._connect()
+            with connection:
+                deleted = connection.execute(
+                    "DELETE FROM outbox WHERE state != ? AND done_at < ?",
+                    (PENDING, time.time() - OUTBOX_RETENTION),
+                ).rowcount
+            if deleted:
+                connection.execute("PRAGMA incremental_vacuum")
+            return deleted
+
+        while True:
+            await asyncio.sleep(OUTBOX_COMPACT_INTERVAL)
+            try:
+                await self._run(compact)
+            except Exception as e:
+                print(f"Error compacting the outbox: {e}")
+
+    async def join(self) -> None:
+        """Waits until every stored entry that is due has been attempted."""
+        while self._tasks:
+            if self._commit_task is not None:
+                await asyncio.shield(self._commit_task)
+            await self._idle.wait()
+            if not self._appends and (
+                self._commit_task is None or self._commit_task.done()
+            ):
+                return
+
+    async def stop(self) -> None:
+        """Stops delivering, what is left is delivered after the next start."""
+        tasks = [*self._tasks, *self._sending]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        for task in (self._commit_task, self._record_task):
+            if task is not None:
+                await asyncio.shield(task)
+
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(close)
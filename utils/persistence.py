@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from telegram.ext import BasePersistence, PersistenceInput
+from dotenv import load_dotenv
+
+load_dotenv()
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "gifty.sqlite3")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+# users and chats remembered as loaded, one forgotten is read again on its next update
+PERSISTENCE_LOADED_CACHE_SIZE = int(
+    os.getenv("PERSISTENCE_LOADED_CACHE_SIZE", "100000")
+)
+
+ConversationKey = tuple[int | str, ...]
+ConversationDict = dict[ConversationKey, object]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, PRIMARY KEY (name, key)
+);
+"""
+
+
+class SQLitePersistence(BasePersistence[dict, dict, dict]):
+    """Keeps user_data, chat_data and conversation states in a local SQLite file.
+
+    Writes are write-behind: the application hands over changed data every
+    ``update_interval`` seconds and all of it is committed in one transaction on a
+    dedicated thread, so no update waits on the disk. user_data and chat_data are
+    loaded the first time a user or chat shows up instead of at startup.
+    """
+
+    def __init__(
+        self,
+        path: str = PERSISTENCE_PATH,
+        update_interval: float = PERSISTENCE_INTERVAL,
+        max_loaded: int = PERSISTENCE_LOADED_CACHE_SIZE,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=True, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.path = path
+        # a single thread owns the connection, which also serializes the writes
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="persistence"
+        )
+        self._connection: sqlite3.Connection | None = None
+        # ids whose row was read (or written) already, least recently seen first
+        self._loaded: dict[str, OrderedDict[int, None]] = {
+            "user_data": OrderedDict(),
+            "chat_data": OrderedDict(),
+        }
+        self._max_loaded = max_loaded
+        # (table, id) -> json or None to delete, ordered writes for conversations
+        self._pending: dict[tuple[str, Any], str | None] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, fn, *args
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL with synchronous=NORMAL does not fsync on every commit
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    # ---- Loading ----
+
+    async def get_user_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        # only active conversations are stored, and the handler needs them all at startup
+        def load():
+            rows = (
+                self._connect()
+                .execute("SELECT key, state FROM conversations WHERE name = ?", (name,))
+                .fetchall()
+            )
+            return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+        return await self._run(load)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._load_once("user_data", "user_id", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._load_once("chat_data", "chat_id", chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def _load_once(self, table: str, column: str, id: int, data: dict) -> None:
+        if self._seen(table, id):
+            return
+
+        def load():
+            return (
+                self._connect()
+                .execute(f"SELECT data FROM {table} WHERE {column} = ?", (id,))
+                .fetchone()
+            )
+
+        row = await self._run(load)
+        if row:
+            # anything set before the row arrived is newer than the stored copy
+            data.update({**json.loads(row[0]), **data})
+
+    async def get_user_value(self, user_id: int, field: str) -> Any:
+        """One field of a user's stored user_data, for a user this process has no update from."""
+        pending = self._pending.get(("user_data", user_id))
+        if pending is not None:
+            # not written yet, newer than the row
+            return json.loads(pending).get(field)
+
+        def load():
+            return (
+                self._connect()
+                .execute(
+                    "SELECT json_extract(data, '$.' || ?) FROM user_data WHERE user_id = ?",
+                    (field, user_id),
+                )
+                .fetchone()
+            )
+
+        row = await self._run(load)
+        return row[0] if row else None
+
+    def _seen(self, table: str, id: int) -> bool:
+        """Marks a row as loaded, True if it already was."""
+        loaded = self._loaded[table]
+        if id in loaded:
+            loaded.move_to_end(id)
+            return True
+        loaded[id] = None
+        if len(loaded) > self._max_loaded:
+            # the in-memory data wins over the row when it's read again, nothing is lost
+            loaded.popitem(last=False)
+        return False
+
+    # ---- Write-behind ----
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._seen("user_data", user_id)
+        self._queue(("user_data", user_id), json.dumps(data, default=str))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._seen("chat_data", chat_id)
+        self._queue(("chat_data", chat_id), json.dumps(data, default=str))
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(
+        self, name: str, key: ConversationKey, new_state: object | None
+    ) -> None:
+        self._queue(
+            ("conversations", (name, json.dumps(list(key)))),
+            None if new_state is None else json.dumps(new_state),
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._queue(("user_data", user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._queue(("chat_data", chat_id), None)
+
+    def _queue(self, key: tuple[str, Any], value: str | None) -> None:
+        self._pending[key] = value
+        # the application updates every changed chat at once, commit them together
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def _flush_pending(self) -> None:
+        await asyncio.sleep(0)
+        # changes queued while a write is on disk go in the next one, not after the next update
+        while self._pending:
+            pending, self._pending = self._pending, {}
+            try:
+                await self._run(self._write, pending)
+            except Exception as e:
+                # the transaction was rolled back, keep the changes for the next flush
+                # behind anything queued meanwhile, which is newer
+                self._pending = {**pending, **self._pending}
+                print(
+                    f"WARNING:  Persistence: writing {len(pending)} changes failed, retrying on the next flush: {e}"
+                )
+                return
+
+    def _write(self, pending: dict[tuple[str, Any], str | None]) -> None:
+        connection = self._connect()
+        with connection:
+            for (table, id), value in pending.items():
+                if table == "conversations":
+                    name, key = id
+                    if value is None:
+                        connection.execute(
+                            "DELETE FROM conversations WHERE name = ? AND key = ?",
+                            (name, key),
+                        )
+                    else:
+                        connection.execute(
+                            "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                            (name, key, value),
+                        )
+                else:
+                    column = "user_id" if table == "user_data" else "chat_id"
+                    if value is None:
+                        connection.execute(
+                            f"DELETE FROM {table} WHERE {column} = ?", (id,)
+                        )
+                    else:
+                        connection.execute(
+                            f"INSERT OR REPLACE INTO {table} ({column}, data) VALUES (?, ?)",
+                            (id, value),
+                        )
+
+    async def flush(self) -> None:
+        if self._flush_task:
+            await self._flush_task
+        await self._flush_pending()
+
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(close)
@@ -0,0 +1,37 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+# /debug/profile is only served when this is set, and only to requests carrying it
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+
+def _folded(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample(thread_id: int, seconds: float, interval: float = 0.005) -> str:
+    """Samples a thread's stack for ``seconds`` and returns it as folded stacks.
+
+    Every line is ``outer;...;inner count``, the input of flamegraph.pl and speedscope.
+    Meant to run in its own thread while the sampled one keeps working, nothing is
+    installed in the sampled thread so there is no cost outside of a profile.
+    """
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    me = threading.get_ident()
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None and thread_id != me:
+            stacks[_folded(frame)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+from typing import Awaitable, Callable, Hashable
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+# how long a customer has to confirm or reject before the prompt is taken away
+REDEMPTION_TIMEOUT = float(os.getenv("REDEMPTION_TIMEOUT", "600"))
+# how long a finished redemption is remembered to turn away late taps
+REDEMPTION_RETENTION = float(os.getenv("REDEMPTION_RETENTION", "3600"))
+
+PENDING, DECIDING, DONE, EXPIRED = "pending", "deciding", "done", "expired"
+
+
+class TimerWheel:
+    """Hashed timer wheel, O(1) to schedule and cancel and one task ticking for all timers.
+
+    Timers further away than one turn of the wheel wait for the extra rounds in
+    their slot, so the wheel stays small however long the delays are.
+    """
+
+    def __init__(
+        self, callback: Callable[[Hashable], None], tick: float = 1.0, slots: int = 512
+    ):
+        self._callback = callback
+        self.tick = tick
+        self._slots: list[dict[Hashable, int]] = [{} for _ in range(slots)]
+        # key -> slot holding its timer
+        self._where: dict[Hashable, int] = {}
+        self._cursor = 0
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, key: Hashable, delay: float) -> None:
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        # the slot comes around every len(slots) ticks, rounds counts the extra turns
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable) -> None:
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            self._advance()
+
+    def _advance(self) -> None:
+        """Moves the wheel one tick on and fires the timers due in the new slot."""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        bucket = self._slots[self._cursor]
+        expired = []
+        for key, rounds in bucket.items():
+            if rounds:
+                bucket[key] = rounds - 1
+            else:
+                expired.append(key)
+        for key in expired:
+            del bucket[key]
+            del self._where[key]
+        for key in expired:
+            try:
+                self._callback(key)
+            except Exception as e:
+                print(f"Error in timer for {key}: {e}")
+
+
+class Redemption:
+    __slots__ = ("id", "customer_id", "shop_id", "message_id", "state")
+
+    def __init__(self, id: str, customer_id: int, shop_id: int, message_id: int):
+        self.id = id
+        self.customer_id = customer_id
+        self.shop_id = shop_id
+        self.message_id = message_id
+        self.state = PENDING
+
+
+class RedemptionSaga:
+    """State of every redemption this process prompted a customer for.
+
+    pending -> deciding (the customer tapped, the backend is asked) -> done, or
+    pending -> expired when nobody answers in time. A failed backend call goes back
+    to pending. Redemptions this process never prompted (another worker, before a
+    restart) are unknown and left to the backend to judge.
+    """
+
+    def __init__(
+        self,
+        on_expire: Callable[[Redemption], Awaitable[None]],
+        timeout: float = REDEMPTION_TIMEOUT,
+        retention: float = REDEMPTION_RETENTION,
+    ):
+        self._on_expire = on_expire
+        self.timeout = timeout
+        self.retention = retention
+        self._records: dict[str, Redemption] = {}
+        self._wheel = TimerWheel(self._on_timer)
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def start(self) -> None:
+        self._wheel.start()
+
+    async def stop(self) -> None:
+        await self._wheel.stop()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get(self, id: str) -> Redemption | None:
+        return self._records.get(id)
+
+    def prompted(
+        self, id: str, customer_id: int, shop_id: int, message_id: int
+    ) -> None:
+        """The customer got the confirm/reject prompt, the countdown starts."""
+        self._records[id] = Redemption(id, customer_id, shop_id, message_id)
+        self._wheel.schedule(id, self.timeout)
+        metrics.redemptions.inc(PENDING)
+
+    def begin(self, id: str) -> Redemption | None:
+        """Claims a pending redemption for the customer's answer.
+
+        Returns the record that is no longer pending when the tap is stale, None
+        when the answer may go to the backend.
+        """
+        record = self._records.get(id)
+        if record is None:
+            return None
+        if record.state != PENDING:
+            return record
+        record.state = DECIDING
+        self._wheel.cancel(id)
+        return None
+
+    def abort(self, id: str) -> None:
+        """The answer did not reach the backend, the customer may tap again."""
+        record = self._records.get(id)
+        if record and record.state == DECIDING:
+            record.state = PENDING
+            self._wheel.schedule(id, self.timeout)
+
+    def finish(self, id: str) -> None:
+        record = self._records.get(id)
+        if record and record.state != DONE:
+            record.state = DONE
+            self._wheel.schedule(id, self.retention)
+            metrics.redemptions.inc(DONE)
+
+    def _on_timer(self, id: str) -> None:
+        record = self._records.get(id)
+        if record is None:
+            return
+        if record.state != PENDING:
+            # kept long enough to turn away late taps
+            del self._records[id]
+            return
+        record.state = EXPIRED
+        self._wheel.schedule(id, self.retention)
+        metrics.redemptions.inc(EXPIRED)
+        task = asyncio.create_task(self._on_expire(record))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# starts where the bot's own concurrency is, the limit only comes down on measured congestion
+LIMITER_INITIAL = int(
+    os.getenv("LIMITER_INITIAL", os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+)
+LIMITER_MIN = int(os.getenv("LIMITER_MIN", "2"))
+LIMITER_MAX = int(os.getenv("LIMITER_MAX", "200"))
+# recent latency above this many times the usual latency counts as congestion
+LIMITER_TOLERANCE = float(os.getenv("LIMITER_TOLERANCE", "2.0"))
+# how long a call over the limit waits for a slot before it is turned away
+LIMITER_QUEUE_TIMEOUT = float(os.getenv("LIMITER_QUEUE_TIMEOUT", "1.0"))
+
+
+class BackendUnavailable(Exception):
+    """The call was not made: the endpoint's breaker is open or its limit is reached."""
+
+    def __init__(self, endpoint: str, reason: str):
+        super().__init__(f"Backend {endpoint} unavailable: {reason}")
+        self.endpoint = endpoint
+        self.reason = reason
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        metrics.circuit_state.set(0, name)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        print(f"WARNING:  Backend circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        metrics.circuit_state.set(self.STATE_VALUES[state], self.name)
+        metrics.circuit_transitions.inc(self.name, state)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            # a single probe decides whether the endpoint is back
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def cancel_probe(self) -> None:
+        self._probing = False
+
+    def record_success(self) -> None:
+        # calls started before the circuit opened do not close it, only the probe does
+        if self.state == self.OPEN:
+            return
+        self.failures = 0
+        self._probing = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        if self.state == self.OPEN:
+            return
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adapts to the endpoint's latency (AIMD).
+
+    Recent latency (a fast moving average) is compared to the endpoint's usual
+    latency (an average that follows drops quickly and rises by at most 1% a second).
+    While it stays within LIMITER_TOLERANCE times the usual, calls raise the limit by
+    one per limit's worth of calls. Above that, or when a call fails, the limit is cut
+    by 10%, at most once per recent latency so one slow burst counts once. Calls over
+    the limit wait up to ``queue_timeout`` for a slot, in order, and are turned away
+    after that instead of piling up behind a congested endpoint.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = LIMITER_INITIAL,
+        minimum: int = LIMITER_MIN,
+        maximum: int = LIMITER_MAX,
+        queue_timeout: float = LIMITER_QUEUE_TIMEOUT,
+    ):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self._waiters: deque[asyncio.Future] = deque()
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.recent_latency = None
+        self.usual_latency = None
+        self._last_cut = 0.0
+        self._updated = time.monotonic()
+        metrics.concurrency_limit.set(initial, name)
+
+    async def acquire(self) -> bool:
+        """Takes a slot, False if none freed up within the queue timeout."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # a slot handed over just as the wait ran out is still taken
+            if future.done():
+                return True
+            future.cancel()
+            metrics.backend_shed.inc(self.name)
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.abandon()
+            else:
+                future.cancel()
+            raise
+        return True
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def abandon(self) -> None:
+        """Release a slot whose call was cancelled, without adapting the limit."""
+        self.in_flight -= 1
+        self._wake()
+
+    def release(self, latency: float, ok: bool) -> None:
+        self.in_flight -= 1
+        now = time.monotonic()
+        if ok:
+            if self.usual_latency is None:
+                self.recent_latency = self.usual_latency = latency
+            else:
+                self.recent_latency += 0.2 * (latency - self.recent_latency)
+                if latency < self.usual_latency:
+                    self.usual_latency += 0.05 * (latency - self.usual_latency)
+                else:
+                    # rises by time, not by calls, so heavy queueing can not pass for normal
+                    rise = self.usual_latency * 0.01 * (now - self._updated)
+                    self.usual_latency += min(latency - self.usual_latency, rise)
+            self._updated = now
+            congested = self.recent_latency > self.usual_latency * LIMITER_TOLERANCE
+        else:
+            congested = True
+
+        if congested:
+            if now - self._last_cut >= (self.recent_latency or 0.0):
+                self._last_cut = now
+                self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        metrics.concurrency_limit.set(int(self.limit), self.name)
+        self._wake()
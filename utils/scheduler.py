@@ -0,0 +1,290 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import suppress
+from typing import Any, Callable, Coroutine
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from dotenv import load_dotenv
+from utils import tracing
+
+load_dotenv()
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "8"))
+MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", "3"))
+
+# lower value goes first
+REPLY = 0
+NOTIFICATION = 1
+
+# methods that put or change a message in a chat, these are the ones Telegram limits
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward", "delete")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Chat:
+    """The messages queued for one chat, in order, and the chat's bucket."""
+
+    __slots__ = ("bucket", "queue", "busy", "entry", "waiting")
+
+    def __init__(self):
+        self.bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+        # (priority, sequence, callback, args, kwargs, future, span, queued_at)
+        self.queue: list[tuple] = []
+        # a worker is sending this chat's message, the next one waits for it
+        self.busy = False
+        # the chat's current entry in the ready heap, None when it isn't there
+        self.entry: tuple | None = None
+        # in the waiting heap, for its bucket to refill
+        self.waiting = False
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """Queues every outgoing message and releases it within Telegram's limits.
+
+    A global bucket keeps the bot under ~30 messages/s and one bucket per chat under
+    ~1 message/s (with a small burst). Each chat has its own queue and sends one
+    message at a time, in order; workers only pick chats whose bucket has a token, so
+    a throttled chat waits in a heap by the time it's ready instead of holding a
+    worker. Replies to user input (``REPLY``, the default) are sent before backend
+    notifications (``rate_limit_args=NOTIFICATION``) and a ``RetryAfter`` pauses the
+    whole queue for the time Telegram asks for.
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS):
+        self._workers = workers
+        self._tasks: list[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chats: dict[int | str, _Chat] = {}
+        # (priority, sequence) of the chat's next message, chat_id: chats that can send now
+        self._ready: list[tuple] = []
+        # (ready_at, chat_id): chats waiting for their bucket
+        self._waiting: list[tuple[float, int | str]] = []
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        # queued messages, and those plus the ones being sent
+        self._queued = 0
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    async def initialize(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self._workers)
+        ]
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self) -> None:
+        """Waits until every queued message has been sent (or has failed)."""
+        await self._finished.wait()
+
+    def discard_pending(self) -> int:
+        """Cancels the messages still waiting in the queue, returns how many there were."""
+        discarded = 0
+        for chat in self._chats.values():
+            for item in chat.queue:
+                item[5].cancel()
+                discarded += 1
+            chat.queue.clear()
+            chat.entry = None
+            chat.waiting = False
+        self._ready.clear()
+        self._waiting.clear()
+        self._queued = 0
+        self._task_done(discarded)
+        return discarded
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict | list[dict]:
+        if not endpoint.startswith(LIMITED_PREFIXES) or "chat_id" not in data:
+            return await self._call(callback, args, kwargs)
+
+        chat_id = data["chat_id"]
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) > 10_000:
+                self._prune()
+            chat = self._chats[chat_id] = _Chat()
+
+        priority = REPLY if rate_limit_args is None else rate_limit_args
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            chat.queue,
+            (
+                priority,
+                next(self._sequence),
+                callback,
+                args,
+                kwargs,
+                future,
+                tracing.current_span(),
+                time.monotonic(),
+            ),
+        )
+        self._queued += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._schedule(chat_id, chat, time.monotonic())
+        return await future
+
+    def _schedule(self, chat_id: int | str, chat: _Chat, now: float) -> None:
+        """Puts a chat with queued messages in the ready or the waiting heap."""
+        if chat.busy or chat.waiting or not chat.queue:
+            return
+        delay = chat.bucket.delay(now)
+        if delay > 0:
+            chat.waiting = True
+            heapq.heappush(self._waiting, (now + delay, chat_id))
+        else:
+            head = chat.queue[0][:2]
+            if chat.entry is not None and chat.entry[:2] <= head:
+                return
+            # a reply queued behind a notification moves the chat up, the old entry is skipped
+            chat.entry = (*head, chat_id)
+            heapq.heappush(self._ready, chat.entry)
+        self._wakeup.set()
+
+    async def _next(self) -> tuple[int | str, _Chat, tuple]:
+        """Waits for a chat that may send and takes its next message."""
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, chat_id = heapq.heappop(self._waiting)
+                chat = self._chats.get(chat_id)
+                if chat is not None and chat.waiting:
+                    chat.waiting = False
+                    self._schedule(chat_id, chat, now)
+
+            delay = max(self._paused_until - now, self._global.delay(now))
+            if self._ready and delay <= 0:
+                entry = heapq.heappop(self._ready)
+                chat_id = entry[2]
+                chat = self._chats.get(chat_id)
+                if chat is None or chat.entry != entry:
+                    continue
+                chat.entry = None
+                item = heapq.heappop(chat.queue)
+                self._queued -= 1
+                if item[5].cancelled():
+                    self._task_done()
+                    self._schedule(chat_id, chat, now)
+                    continue
+                chat.busy = True
+                chat.bucket.consume()
+                self._global.consume()
+                return chat_id, chat, item
+
+            if self._ready:
+                timeout = delay
+            elif self._waiting:
+                timeout = self._waiting[0][0] - now
+            else:
+                timeout = None
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    def _task_done(self, count: int = 1) -> None:
+        self._unfinished -= count
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id, chat, item = await self._next()
+            _, _, callback, args, kwargs, future, span, queued_at = item
+            try:
+                if span is None:
+                    result = await self._call(callback, args, kwargs)
+                else:
+                    # the send belongs to the trace of whoever queued it
+                    wait_ms = round((time.monotonic() - queued_at) * 1000, 1)
+                    with tracing.start_span("outbound", parent=span, wait_ms=wait_ms):
+                        result = await self._call(callback, args, kwargs)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                chat.busy = False
+                self._schedule(chat_id, chat, time.monotonic())
+                self._task_done()
+
+    def _prune(self) -> None:
+        # an idle chat with a full bucket holds no state a fresh one would not have
+        now = time.monotonic()
+        idle = [
+            chat_id
+            for chat_id, chat in self._chats.items()
+            if not chat.queue and not chat.busy and chat.bucket.full(now)
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def _call(self, callback, args, kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                retry_after = e.retry_after
+                if hasattr(retry_after, "total_seconds"):
+                    retry_after = retry_after.total_seconds()
+                print(f"WARNING:  Telegram flood control, retrying in {retry_after}s")
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+                await asyncio.sleep(retry_after)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+# how long a user the backend does not know as a shop is taken at its word
+SHOP_NEGATIVE_TTL = float(os.getenv("SHOP_NEGATIVE_TTL", "300"))
+SHOP_NEGATIVE_SIZE = int(os.getenv("SHOP_NEGATIVE_SIZE", "100000"))
+SHOP_PRELOAD_PAGE_SIZE = int(os.getenv("SHOP_PRELOAD_PAGE_SIZE", "500"))
+
+
+class ShopRegistry:
+    """Every shop by telegram_id, preloaded at startup and kept current by backend events.
+
+    Ids the backend does not know as shops are remembered for a while too, so only ids
+    never seen reach the backend. Concurrent misses for the same id share one lookup.
+    """
+
+    def __init__(
+        self,
+        backend,
+        negative_ttl: float = SHOP_NEGATIVE_TTL,
+        max_negative: int = SHOP_NEGATIVE_SIZE,
+    ):
+        self._backend = backend
+        self._negative_ttl = negative_ttl
+        self._max_negative = max_negative
+        self._shops: dict[int, dict[str, Any]] = {}
+        # telegram_id -> expires_at, oldest first
+        self._missing: OrderedDict[int, float] = OrderedDict()
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._shops)
+
+    async def preload(self) -> None:
+        """Loads all shops page by page, a failure leaves the registry to fill on demand."""
+        start = time.perf_counter()
+        cursor = None
+        try:
+            while True:
+                response = await self._backend.list_shops(
+                    limit=SHOP_PRELOAD_PAGE_SIZE, cursor=cursor
+                )
+                response.raise_for_status()
+                data = response.json()
+                for shop in data.get("shops", []):
+                    self.put(shop)
+                cursor = data.get("next_cursor")
+                if cursor is None:
+                    break
+        except Exception as e:
+            print(f"WARNING:  Shop preload stopped after {len(self._shops)} shops: {e}")
+            return
+        print(
+            f"INFO:     Preloaded {len(self._shops)} shops in {time.perf_counter() - start:.2f}s"
+        )
+
+    async def get(self, telegram_id: int) -> dict[str, Any] | None:
+        shop = self._shops.get(telegram_id)
+        if shop is not None:
+            metrics.shop_lookups.inc("hit")
+            return shop
+        expires = self._missing.get(telegram_id)
+        if expires is not None:
+            if expires > time.monotonic():
+                metrics.shop_lookups.inc("negative")
+                return None
+            del self._missing[telegram_id]
+
+        metrics.shop_lookups.inc("miss")
+        task = self._inflight.get(telegram_id)
+        if task is None:
+            task = self._inflight[telegram_id] = asyncio.create_task(
+                self._load(telegram_id)
+            )
+        return await asyncio.shield(task)
+
+    async def _load(self, telegram_id: int) -> dict[str, Any] | None:
+        try:
+            response = await self._backend.get_shop(telegram_id)
+            if response.status_code == 404:
+                self._forget(telegram_id)
+                return None
+            response.raise_for_status()
+            shop = response.json()
+            # an event may have arrived while the lookup was in flight, it wins
+            if telegram_id in self._shops or telegram_id in self._missing:
+                return self._shops.get(telegram_id)
+            self.put(shop, telegram_id)
+            return shop
+        finally:
+            self._inflight.pop(telegram_id, None)
+
+    def put(self, shop: dict[str, Any], telegram_id: int | None = None) -> None:
+        telegram_id = int(shop["telegram_id"]) if telegram_id is None else telegram_id
+        self._shops[telegram_id] = shop
+        self._missing.pop(telegram_id, None)
+
+    def _forget(self, telegram_id: int) -> None:
+        self._shops.pop(telegram_id, None)
+        self._missing[telegram_id] = time.monotonic() + self._negative_ttl
+        self._missing.move_to_end(telegram_id)
+        while len(self._missing) > self._max_negative:
+            self._missing.popitem(last=False)
+
+    def apply(self, event: str, shop: dict[str, Any]) -> None:
+        """Applies a created, updated or deleted event pushed by the backend.
+
+        An update carries only the fields that changed, the rest are kept.
+        """
+        telegram_id = int(shop["telegram_id"])
+        if event == "deleted":
+            self._forget(telegram_id)
+        elif event == "updated" and telegram_id in self._shops:
+            self.put({**self._shops[telegram_id], **shop}, telegram_id)
+        else:
+            self.put(shop, telegram_id)
@@ -1,6 +1,11 @@
-from contextlib import suppress
-from schemas.giftcard import RedeemingTransaction, RedeemingTransactionUpdate, TransactionError
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
+import asyncio
+from schemas.giftcard import (
+    RedeemingTransaction,
+    RedeemingTransactionUpdate,
+    TransactionError,
+)
+from telegram import Bot, Update, ReplyKeyboardRemove
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
     Application,
     MessageHandler,
@@ -10,385 +15,703 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-import httpx
 import os
+import time
 from dotenv import load_dotenv
+from utils import messages, metrics, tracing
+from utils.backend import BackendClient
+from utils.bot_request import InstrumentedRequest
+from utils import callbacks, cluster
+from utils.cache import GiftCardCache
+from utils.cards import CardRenderer
+from utils.idempotency import IdempotencyStore
+from utils.outbox import OUTBOX_PATH, Outbox
+from utils.persistence import PERSISTENCE_PATH, SQLitePersistence
+from utils.redemptions import EXPIRED, RedemptionSaga
+from utils.resilience import BackendUnavailable
+from utils.scheduler import NOTIFICATION, OutboundScheduler
+from utils.shops import ShopRegistry
+from utils.updates import ChatOrderedUpdateProcessor
 
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-BACKEND_URL = os.getenv("BACKEND_URL")
+# the Bot API server, overridden to point the bot at a local stand-in (see bench/)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# "polling" or "webhook", webhook updates are received by the FastAPI app
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+# gift cards per listing page, one backend fetch each
+GIFT_CARD_PAGE_SIZE = int(os.getenv("GIFT_CARD_PAGE_SIZE", "10"))
 NIT, NAME, EMAIL, PHONE = range(4)
 
+
+async def register_webhook(bot: Bot | None = None) -> None:
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError(
+            "WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode"
+        )
+    if bot is None:
+        async with Bot(TELEGRAM_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot") as bot:
+            await register_webhook(bot)
+        return
+    await bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+    )
+
+
 class TelegramClient:
-    def __init__(self):
-        self.bot_application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # callback query handlers by payload type, registered with @routes below
+    routes = callbacks.CallbackRouter()
+
+    def __init__(self, worker: int | None = None):
+        # index of this cluster worker, None when the bot runs in a single process
+        self.worker = worker
+        # every message the bot sends goes through the scheduler
+        self.scheduler = OutboundScheduler()
+        self.update_processor = ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES)
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .base_url(f"{TELEGRAM_API_URL}/bot")
+            .request(InstrumentedRequest(connection_pool_size=256))
+            .get_updates_request(InstrumentedRequest())
+            .concurrent_updates(self.update_processor)
+            .rate_limiter(self.scheduler)
+            .persistence(
+                SQLitePersistence(cluster.worker_path(PERSISTENCE_PATH, worker))
+            )
+        )
+        if BOT_MODE == "webhook":
+            builder = builder.updater(None)
+        self.bot_application = builder.build()
+        self.backend = BackendClient()
+        self.gift_cards = GiftCardCache(self._load_gift_cards)
+        self.shops = ShopRegistry(self.backend)
+        self.idempotency = IdempotencyStore()
+        self.redemptions = RedemptionSaga(self._expire_redemption)
+        self.cards = CardRenderer()
+        # backend notifications, stored until they are delivered
+        self.outbox = Outbox(self, cluster.worker_path(OUTBOX_PATH, worker))
 
         # Conversation handler for shop creation
-        shop_conversation_handler = ConversationHandler( 
-            entry_points=[CommandHandler("shop", self.start_shop_creation)], 
-            states={ 
-                NIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_nit)], 
-                NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_name)], 
-                EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_email)], 
-                PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_phone)], 
+        shop_conversation_handler = ConversationHandler(
+            entry_points=[CommandHandler("shop", self.start_shop_creation)],
+            states={
+                NIT: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_nit)
+                ],
+                NAME: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_name)
+                ],
+                EMAIL: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_email)
+                ],
+                PHONE: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.collect_phone)
+                ],
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)], 
+            fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="shop_creation",
+            persistent=True,
         )
 
         # Add handlers
         self.bot_application.add_handler(shop_conversation_handler)
         self.bot_application.add_handler(
-            MessageHandler(
-                filters.TEXT & ~filters.COMMAND, self.welcome_message
-            )
+            MessageHandler(filters.TEXT & ~filters.COMMAND, self.welcome_message)
         )
         self.bot_application.add_handler(CallbackQueryHandler(self.button_handler))
 
-    def start(self):
-        print("INFO:     Started gifty telegram bot 🚀🤖📱")
-        self.bot_application.run_polling()
+    async def start(self):
+        # runs on the caller's event loop (the FastAPI lifespan) instead of run_polling()
+        await self.bot_application.initialize()
+        await self.bot_application.start()
+        self.redemptions.start()
+        self.cards.start()
+        await self.outbox.start()
+        if BOT_MODE == "webhook":
+            # the supervisor registers the webhook for all the workers
+            if self.worker is None:
+                await register_webhook(self.bot_application.bot)
+        else:
+            await self.bot_application.updater.start_polling()
+        print(f"INFO:     Started gifty telegram bot ({BOT_MODE}) 🚀🤖📱")
 
     async def stop(self):
-        await self.bot_application.stop()
-        await self.bot_application.shutdown()
+        # also after a start that failed partway, every step runs and skips what never started
+        updater = self.bot_application.updater
+        steps = [updater.stop] if updater and updater.running else []
+        steps += [self.redemptions.stop, self.outbox.stop]
+        if self.bot_application.running:
+            steps.append(self.bot_application.stop)
+        steps += [self.bot_application.shutdown, self.backend.close, self.cards.stop]
+        for step in steps:
+            try:
+                await step()
+            except Exception as e:
+                print(f"WARNING:  Stopping the bot: {step.__qualname__} failed: {e}")
         print("Stopped gifty telegram bot")
 
-    #TODO change the name of this function
+    async def drain(self) -> None:
+        """Stops fetching updates and waits for the queued ones and their messages."""
+        updater = self.bot_application.updater
+        if updater and updater.running:
+            await updater.stop()
+        await self.bot_application.update_queue.join()
+        await self.outbox.join()
+        await self.scheduler.join()
+
+    def discard_pending(self) -> tuple[int, int]:
+        """Drops the updates and messages not done yet, returns how many of each."""
+        update_queue = self.bot_application.update_queue
+        updates = self.update_processor.cancel_pending()
+        while not update_queue.empty():
+            update_queue.get_nowait()
+            update_queue.task_done()
+            updates += 1
+        return updates, self.scheduler.discard_pending()
+
+    async def enqueue_update(self, data: dict) -> None:
+        update = Update.de_json(data, self.bot_application.bot)
+        tracing.carry(update.update_id)
+        await self.bot_application.update_queue.put(update)
+
+    # TODO change the name of this function
     async def welcome_message(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         user_id = update.message.from_user.id
 
+        language = self.language(context, update.message.from_user)
+
         if context.user_data.get("awaiting_gift_card_code"):
             gc_code = update.message.text
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{BACKEND_URL}/giftcards/redeem/",
-                        json={"telegram_id": user_id, "gc_code": gc_code}
-                    )
+                response = await self.backend.redeem_gift_card(user_id, gc_code)
 
-                    
-                    
-                    if response.status_code == 201:
-                        redeeming_transaction = RedeemingTransaction(**response.json())
-                        await self.bot_application.bot.send_message(
-                            chat_id=int(redeeming_transaction.customer_telegram_id),
+                if response.status_code == 201:
+                    redeeming_transaction = RedeemingTransaction(**response.json())
+                    customer_id = int(redeeming_transaction.customer_telegram_id)
+                    customer_language = await self.chat_language(customer_id)
+                    prompt, _ = await asyncio.gather(
+                        self.bot_application.bot.send_message(
+                            chat_id=customer_id,
                             text=redeeming_transaction.message,
-                            reply_markup=InlineKeyboardMarkup([
-                                [InlineKeyboardButton("Confirm", callback_data=f"redeem_confirm__{redeeming_transaction.id}")],
-                                [InlineKeyboardButton("Reject", callback_data=f"redeem_reject__{redeeming_transaction.id}")],
-                            ])
-                        )
-                        return await update.message.reply_text("⏳ Awaiting for customer to validate redemption...")
-                       
-                    else:
-                        transaction_error = TransactionError(**response.json()).error
-                        await update.message.reply_text(
-                            transaction_error
+                            reply_markup=messages.redeem_keyboard(
+                                customer_language, redeeming_transaction.id
+                            ),
+                            rate_limit_args=NOTIFICATION,
+                        ),
+                        update.message.reply_text(
+                            messages.render("awaiting_customer", language),
+                            parse_mode=messages.PARSE_MODE,
+                        ),
+                    )
+                    # the customer's answer and the expiry run on the worker that owns the customer's chat,
+                    # a saga recorded here would expire and overwrite a prompt already answered there
+                    if cluster.owns(customer_id):
+                        self.redemptions.prompted(
+                            redeeming_transaction.id,
+                            customer_id,
+                            user_id,
+                            prompt.message_id,
                         )
+                    return
+
+                else:
+                    transaction_error = TransactionError(**response.json()).error
+                    await update.message.reply_text(transaction_error)
+            except BackendUnavailable:
+                await update.message.reply_text(
+                    messages.render("backend_busy", language),
+                    parse_mode=messages.PARSE_MODE,
+                )
             except Exception as e:
                 print(f"Error during gift card redemption: {e}")
-                await update.message.reply_text("An error occurred during redemption. Please try again.")
+                await update.message.reply_text(
+                    messages.render("redemption_error", language),
+                    parse_mode=messages.PARSE_MODE,
+                )
 
-        
         else:
             consumer_name = update.message.from_user.first_name
 
             # Send the welcome message along with gift card info
             await update.message.reply_text(
-                f"🎁 Hi {consumer_name}, welcome to Gifty! ", reply_markup=self.get_menu()
+                messages.render("welcome", language, name=consumer_name),
+                parse_mode=messages.PARSE_MODE,
+                reply_markup=self.get_menu(language),
             )
 
-    async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    async def button_handler(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
         query = update.callback_query
         await query.answer()
-        user_id = query.from_user.id
-        message_id = query.message.message_id
+        language = self.language(context, query.from_user)
+        start = time.perf_counter()
+        route = "unknown"
 
         try:
-            if query.data == "buy":
-                await self.handle_buy_selection(query)
-
-            elif query.data in ["10000", "30000", "50000", "100000"]:
-                await self.handle_payment_process(query, user_id, message_id)
-
-            elif query.data == "redeem":
-                await self.handle_redeem_gift_cards(query, user_id, context)
-
-            elif query.data.startswith("gc"):
-                await self.handle_gift_card_details(query, context)
-            
-            elif query.data == "shop_redeem":
-                await self.handle_redeem_shop(query, user_id, context)
-            
-            elif query.data.startswith("redeem_confirm") or query.data.startswith("redeem_reject"):
-                await self.handle_customer_redeem_confirm(query,context)
-            else:
+            try:
+                target, payload = self.routes.resolve(query.data)
+            except callbacks.InvalidCallback as e:
+                # rejected before any handler or backend call
+                metrics.callbacks_rejected.inc(e.reason)
                 await query.edit_message_text(
-                    text="You have no active gift cards to redeem."
+                    text=messages.render("unknown_action", language),
+                    parse_mode=messages.PARSE_MODE,
                 )
+                return
+            route = target.name
+            await target.handler(self, query, context, payload)
+        except BackendUnavailable:
+            await query.edit_message_text(
+                text=messages.render("backend_busy", language),
+                parse_mode=messages.PARSE_MODE,
+            )
         except Exception as e:
             print(f"An error occurred: {e}")
+            metrics.errors.inc("callback")
             await query.edit_message_text(
-                text="❗ An unexpected error occurred. Please try again later."
+                text=messages.render("unexpected_error", language),
+                parse_mode=messages.PARSE_MODE,
             )
+        finally:
+            metrics.callback_duration.observe(time.perf_counter() - start, route)
 
     # ---- Helper Functions ----
 
-    async def handle_buy_selection(self, query) -> None:
+    @routes(callbacks.Buy, "buy")
+    async def handle_buy_selection(
+        self, query, context: ContextTypes.DEFAULT_TYPE, payload: callbacks.Buy
+    ) -> None:
         """Handles the 'buy' selection to show amount options."""
-        amount_keyboard = [
-            [InlineKeyboardButton("10,000", callback_data="10000")],
-            [InlineKeyboardButton("30,000", callback_data="30000")],
-            [InlineKeyboardButton("50,000", callback_data="50000")],
-            [InlineKeyboardButton("100,000", callback_data="100000")],
-        ]
-        amount_reply_markup = InlineKeyboardMarkup(amount_keyboard)
         await query.edit_message_text(
-            text="Select the amount:", reply_markup=amount_reply_markup
+            text=messages.render("select_amount", self.language(context)),
+            parse_mode=messages.PARSE_MODE,
+            reply_markup=messages.amounts_keyboard(),
         )
 
-
-    async def handle_payment_process(self, query, user_id: int, message_id: int) -> None:
+    @routes(
+        callbacks.Amount,
+        "amount",
+        check=lambda payload: payload.amount in messages.AMOUNTS,
+    )
+    async def handle_payment_process(
+        self, query, context: ContextTypes.DEFAULT_TYPE, payload: callbacks.Amount
+    ) -> None:
         """Handles the payment process for a selected amount."""
-        post_data = {
-            "amount": int(query.data),
-            "channel": "telegram",
-            "user_channel_id": str(user_id),
-            "user_message_id": message_id
-        }
-
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(f"{BACKEND_URL}/giftcards/buy/", json=post_data)
-                if response.status_code == 200:
-                    data = response.json()
-                    payment_link = data.get("payment_link_url")
-                    if payment_link:
-                        pay_button = [[InlineKeyboardButton("Pay", url=payment_link)]]
-                        await query.edit_message_text(
-                            text="Please complete the payment by clicking 👇:",
-                            reply_markup=InlineKeyboardMarkup(pay_button),
-                        )
-                    else:
-                        await query.edit_message_text(
-                            text="We could not retrieve the payment link. Please try again."
-                        )
+        language = self.language(context)
+        try:
+            response = await self.backend.buy_gift_card(
+                payload.amount, str(query.from_user.id), query.message.message_id
+            )
+            if response.status_code == 200:
+                data = response.json()
+                payment_link = data.get("payment_link_url")
+                if payment_link:
+                    await query.edit_message_text(
+                        text=messages.render("pay_prompt", language),
+                        parse_mode=messages.PARSE_MODE,
+                        reply_markup=messages.pay_keyboard(language, payment_link),
+                    )
                 else:
                     await query.edit_message_text(
-                        text="There was an error processing your purchase. Please try again."
+                        text=messages.render("no_payment_link", language),
+                        parse_mode=messages.PARSE_MODE,
                     )
-            except Exception as e:
-                print(f"Error during payment process: {e}")
+            else:
                 await query.edit_message_text(
-                    text="An error occurred while processing your request."
+                    text=messages.render("purchase_error", language),
+                    parse_mode=messages.PARSE_MODE,
                 )
+        except BackendUnavailable:
+            await query.edit_message_text(
+                text=messages.render("backend_busy", language),
+                parse_mode=messages.PARSE_MODE,
+            )
+        except Exception as e:
+            print(f"Error during payment process: {e}")
+            await query.edit_message_text(
+                text=messages.render("request_error", language),
+                parse_mode=messages.PARSE_MODE,
+            )
 
-
-    async def handle_redeem_gift_cards(self, query, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handles fetching and displaying redeemable gift cards."""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(f"{BACKEND_URL}/giftcards/", params={"telegram_id": user_id})
-                gift_cards = response.json().get("gift_cards", [])
-                if gift_cards:
-                    gcs_list = [
-                        [InlineKeyboardButton(f"Code: {gc['code']} - Balance: ${gc['balance']}", callback_data=f"gc_{gc['code']}")]
-                        for gc in gift_cards
-                    ]
-                    await query.edit_message_text(
-                        text="Your 🎁**Gift Cards**👇",
-                        reply_markup=InlineKeyboardMarkup(gcs_list),
-                        parse_mode="Markdown",
-                    )
-                    context.user_data["gift_cards"] = gift_cards
-                else:
-                    await query.edit_message_text(text="You don't have any gift cards to redeem.")
-            except Exception as e:
-                print(f"Error fetching gift cards: {e}")
+    @routes(callbacks.Redeem, "redeem")
+    @routes(callbacks.GiftCardPage, "gift_card_page")
+    async def handle_redeem_gift_cards(
+        self,
+        query,
+        context: ContextTypes.DEFAULT_TYPE,
+        payload: callbacks.Redeem | callbacks.GiftCardPage,
+    ) -> None:
+        """Handles fetching and displaying a page of redeemable gift cards."""
+        language = self.language(context)
+        page = payload.page if isinstance(payload, callbacks.GiftCardPage) else 0
+        try:
+            page, listing = await self.gift_cards.page(query.from_user.id, page)
+            if listing.gift_cards:
                 await query.edit_message_text(
-                    text="❗ An error occurred while fetching gift cards. Please try again later."
+                    text=messages.render("gift_cards_title", language),
+                    reply_markup=messages.gift_cards_keyboard(
+                        language,
+                        listing.gift_cards,
+                        page,
+                        has_next=listing.next_cursor is not None,
+                    ),
+                    parse_mode=messages.PARSE_MODE,
                 )
+            else:
+                await query.edit_message_text(
+                    text=messages.render("no_gift_cards", language),
+                    parse_mode=messages.PARSE_MODE,
+                )
+        except BackendUnavailable:
+            await query.edit_message_text(
+                text=messages.render("backend_busy", language),
+                parse_mode=messages.PARSE_MODE,
+            )
+        except Exception as e:
+            print(f"Error fetching gift cards: {e}")
+            await query.edit_message_text(
+                text=messages.render("gift_cards_error", language),
+                parse_mode=messages.PARSE_MODE,
+            )
 
-
-    async def handle_gift_card_details(self, query, context: ContextTypes.DEFAULT_TYPE) -> None:
+    @routes(callbacks.GiftCard, "gift_card")
+    async def handle_gift_card_details(
+        self, query, context: ContextTypes.DEFAULT_TYPE, payload: callbacks.GiftCard
+    ) -> None:
         """Handles displaying the details of a selected gift card."""
-        gift_cards = context.user_data.get("gift_cards", [])
-        gift_card_code = query.data.split("_")[1]
-        matching_card = next((gc for gc in gift_cards if gc["code"] == gift_card_code), None)
-
-        if matching_card:
-            gift_card_message = (
-                f"🎁**Gift Card Details**👇\n\n"
-                f"• **Code**: `{matching_card['code']}`\n"
-                f"• **Status**: {matching_card['status']}\n"
-                f"• **Balance**: {matching_card['balance']} COP\n"
-                f"• **Expires At**: {matching_card['expires_at']}\n\n"
-                "**How to redeem?**\n"
-                "Provide the shop the code above to redeem your balance."
+        _, listing = await self.gift_cards.page(query.from_user.id, payload.page)
+        matching_card = next(
+            (gc for gc in listing.gift_cards if gc["code"] == payload.code), None
+        )
+        language = self.language(context)
+
+        if matching_card and self.cards.enabled:
+            # a new message, the listing stays to pick another card
+            await self.send_gift_card(
+                query.message.chat_id, "gift_card_details", language, matching_card
             )
+        elif matching_card:
             await query.edit_message_text(
-                text=gift_card_message,
-                parse_mode="Markdown",
-                reply_markup=self.get_menu(),
+                text=messages.gift_card("gift_card_details", language, matching_card),
+                parse_mode=messages.PARSE_MODE,
+                reply_markup=self.get_menu(language),
             )
         else:
             await query.edit_message_text(
-                text="You have no active gift card matching the code to redeem."
+                text=messages.render("gift_card_not_found", language),
+                parse_mode=messages.PARSE_MODE,
             )
-    
-    async def handle_customer_redeem_confirm(self, query,context: ContextTypes.DEFAULT_TYPE) -> None:
-        """"""
-        query_parts = query.data.split("__")
-        user_action = query_parts[0]
-        id = query_parts[1]
-        async with httpx.AsyncClient() as client:
-            try:
-                redeem_trasaction = {
-                    "id": id,
-                    "user_action": user_action,
-                }
 
-                response = await client.patch(
-                    f"{BACKEND_URL}/giftcards/redeem/", json=redeem_trasaction
-                )
-                if response.status_code == 200:
-                    redeeming_transaction = RedeemingTransactionUpdate(**response.json())
-                    message = redeeming_transaction.message
+    @routes(callbacks.RedeemAction, "redeem_action")
+    async def handle_customer_redeem_confirm(
+        self, query, context: ContextTypes.DEFAULT_TYPE, payload: callbacks.RedeemAction
+    ) -> None:
+        """Handles the customer confirming or rejecting a shop's redemption."""
+        id = payload.transaction_id
+        # double taps (or confirm and reject) on the same transaction act only once
+        return await self.idempotency.run(
+            ("redeem_action", id),
+            lambda: self.apply_redeem_action(
+                query, payload.user_action, id, self.language(context)
+            ),
+        )
 
-                    #notifies the customer
-                    await query.edit_message_text(
+    async def apply_redeem_action(
+        self, query, user_action: str, id: str, language: str
+    ) -> None:
+        stale = self.redemptions.begin(id)
+        if stale is not None:
+            # answered or expired already, no need to ask the backend
+            key = (
+                "redeem_expired" if stale.state == EXPIRED else "redeem_already_handled"
+            )
+            await query.edit_message_text(
+                text=messages.render(key, language), parse_mode=messages.PARSE_MODE
+            )
+            return
+        try:
+            response = await self.backend.update_redeem(id, user_action)
+            if response.status_code < 500:
+                # the backend has decided, even when it refused the action
+                self.redemptions.finish(id)
+            else:
+                self.redemptions.abort(id)
+            if response.status_code == 200:
+                redeeming_transaction = RedeemingTransactionUpdate(**response.json())
+                message = redeeming_transaction.message
+                self.gift_cards.invalidate(query.from_user.id)
+
+                shop_id = int(redeeming_transaction.shop_telegram_id)
+                shop_language = await self.chat_language(shop_id)
+
+                # notifies the customer and the shop
+                await asyncio.gather(
+                    query.edit_message_text(
                         text=message,
                         parse_mode="Markdown",
-                        reply_markup=self.get_menu(),
-                    )
-                    #notifies the shop
-                    await self.bot_application.bot.send_message(
-                        chat_id=int(redeeming_transaction.shop_telegram_id),
+                        reply_markup=self.get_menu(language),
+                    ),
+                    self.bot_application.bot.send_message(
+                        chat_id=shop_id,
                         text=message,
                         parse_mode="Markdown",
-                        reply_markup=self.get_shop_menu()
-                    )
-                else:
-                    transaction_error = TransactionError(**response.json()).error
-                    await query.edit_message_text(
-                        transaction_error
-                    )
+                        reply_markup=self.get_shop_menu(shop_language),
+                        rate_limit_args=NOTIFICATION,
+                    ),
+                )
+            else:
+                transaction_error = TransactionError(**response.json()).error
+                await query.edit_message_text(transaction_error)
+        except BackendUnavailable:
+            self.redemptions.abort(id)
+            # let it reach button_handler so the idempotency key is forgotten and a retry works
+            raise
+        except Exception as e:
+            self.redemptions.abort(id)
+            await query.edit_message_text(
+                text=messages.render("shop_error", language, error=e),
+                parse_mode=messages.PARSE_MODE,
+            )
+            return ConversationHandler.END
+
+    async def _expire_redemption(self, redemption) -> None:
+        # takes the confirm and reject buttons away from the customer
+        try:
+            await self.bot_application.bot.edit_message_text(
+                chat_id=redemption.customer_id,
+                message_id=redemption.message_id,
+                text=messages.render(
+                    "redeem_expired", await self.chat_language(redemption.customer_id)
+                ),
+                parse_mode=messages.PARSE_MODE,
+                rate_limit_args=NOTIFICATION,
+            )
+        except Exception as e:
+            print(f"Error removing expired redemption prompt {redemption.id}: {e}")
+
+    async def send_gift_card(
+        self, chat_id: int, key: str, language: str, card: dict, **kwargs
+    ):
+        """Sends a gift card as an image captioned with its details, as text if that fails."""
+        text = messages.gift_card(key, language, card)
+        bot = self.bot_application.bot
+        if self.cards.enabled:
+            try:
+                return await self.cards.send(
+                    bot,
+                    chat_id,
+                    card,
+                    caption=text,
+                    parse_mode=messages.PARSE_MODE,
+                    reply_markup=self.get_menu(language),
+                    **kwargs,
+                )
+            except BadRequest as e:
+                print(f"WARNING:  Gift card image rejected, sending text: {e}")
+            except TelegramError:
+                raise
             except Exception as e:
-                await query.edit_message_text(text=f"Error in shop data:\n{e}\nPlease restart.")
-                return ConversationHandler.END
+                print(
+                    f"WARNING:  Gift card image failed to render, sending text: {e!r}"
+                )
+                metrics.errors.inc("card_render")
+            metrics.card_images.inc("text")
+        return await bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=messages.PARSE_MODE,
+            reply_markup=self.get_menu(language),
+            **kwargs,
+        )
+
+    async def _load_gift_cards(
+        self, telegram_id: int, cursor: str | None
+    ) -> tuple[list, str | None]:
+        response = await self.backend.list_gift_cards(
+            telegram_id, limit=GIFT_CARD_PAGE_SIZE, cursor=cursor
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data.get("gift_cards", []), data.get("next_cursor")
+
+    def language(self, context: ContextTypes.DEFAULT_TYPE, user=None) -> str:
+        """The user's catalog language, picked from their Telegram language once and kept in user_data."""
+        language = context.user_data.get("language")
+        if language is None and user is not None:
+            language = context.user_data["language"] = messages.language_for(
+                user.language_code
+            )
+        return language or messages.DEFAULT_LANGUAGE
+
+    async def chat_language(self, chat_id: int) -> str:
+        """Language for messages to a chat outside of its own updates (notifications)."""
+        language = self.bot_application.user_data.get(chat_id, {}).get("language")
+        if language is None:
+            # no update from this user since the process started, their stored user_data has it
+            language = await self.bot_application.persistence.get_user_value(
+                chat_id, "language"
+            )
+        return language or messages.DEFAULT_LANGUAGE
 
-    def get_menu(self):
-        return InlineKeyboardMarkup([
-            [InlineKeyboardButton("Buy", callback_data="buy")],
-            [InlineKeyboardButton("Redeem", callback_data="redeem")],
-        ])
+    def get_menu(self, language: str = messages.DEFAULT_LANGUAGE):
+        return messages.menu(language)
 
-    #Shops--------------------------------------------
+    # Shops--------------------------------------------
 
-    async def handle_redeem_shop(self, query, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
+    @routes(callbacks.ShopRedeem, "shop_redeem")
+    async def handle_redeem_shop(
+        self, query, context: ContextTypes.DEFAULT_TYPE, payload: callbacks.ShopRedeem
+    ) -> None:
+        language = self.language(context)
+        if await self.shops.get(query.from_user.id) is None:
+            await query.edit_message_text(
+                text=messages.render("shop_required", language),
+                parse_mode=messages.PARSE_MODE,
+            )
+            return
         await query.edit_message_text(
-            text="🎁 Insert the gift card code:"
+            text=messages.render("redeem_code_prompt", language),
+            parse_mode=messages.PARSE_MODE,
         )
         context.user_data["awaiting_gift_card_code"] = True
 
-
-    async def start_shop_creation(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def start_shop_creation(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> int:
         context.user_data["conversation_active"] = True
         telegram_id = update.message.from_user.id
-        async with httpx.AsyncClient() as client:
-            try:  
-                response = await client.get(
-                    f"{BACKEND_URL}/shops/?telegram_id={telegram_id}")
-                
-                shop = response.json()
-                if response.status_code == 200:
-                    greeting_message = (
-                    f"Hi {shop['name']}, welcome to Gifty! 🎁"
-                    )
-                    await update.message.reply_text(
-                        greeting_message,
-                        parse_mode="Markdown",
-                        reply_markup=self.get_shop_menu()
-                        )
-                    #context.user_data["conversation_active"] = False
-                else:
-                    raise Exception("Not found")
-
-            except Exception as e:
-                context.user_data["conversation_active"] = True
+        language = self.language(context, update.message.from_user)
+        try:
+            shop = await self.shops.get(telegram_id)
+            if shop is not None:
                 await update.message.reply_text(
-                    "Welcome to the Shop Creator!\n Please provide the shop's NIT:"
+                    messages.render("shop_greeting", language, name=shop["name"]),
+                    parse_mode=messages.PARSE_MODE,
+                    reply_markup=self.get_shop_menu(language),
                 )
-                return NIT
+                # context.user_data["conversation_active"] = False
+            else:
+                raise Exception("Not found")
+
+        except BackendUnavailable:
+            context.user_data["conversation_active"] = False
+            await update.message.reply_text(
+                messages.render("backend_busy", language),
+                parse_mode=messages.PARSE_MODE,
+            )
+            return ConversationHandler.END
+        except Exception:
+            context.user_data["conversation_active"] = True
+            await update.message.reply_text(
+                messages.render("shop_nit_prompt", language),
+                parse_mode=messages.PARSE_MODE,
+            )
+            return NIT
 
-    async def collect_nit(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def collect_nit(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> int:
         context.user_data["nit"] = update.message.text
-        await update.message.reply_text("Got it!\n Now, please provide the shop's name:")
+        await update.message.reply_text(
+            messages.render("shop_name_prompt", self.language(context)),
+            parse_mode=messages.PARSE_MODE,
+        )
         return NAME
 
-    async def collect_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def collect_name(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> int:
         context.user_data["name"] = update.message.text
-        await update.message.reply_text("Great!\n Now, please provide the shop's email:")
+        await update.message.reply_text(
+            messages.render("shop_email_prompt", self.language(context)),
+            parse_mode=messages.PARSE_MODE,
+        )
         return EMAIL
 
-    async def collect_email(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def collect_email(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> int:
         email = update.message.text
         try:
             context.user_data["email"] = email
-            await update.message.reply_text("Thanks!\n Now, provide the shop's phone number:")
+            await update.message.reply_text(
+                messages.render("shop_phone_prompt", self.language(context)),
+                parse_mode=messages.PARSE_MODE,
+            )
             return PHONE
         except Exception:
-            await update.message.reply_text("Invalid email format. Please try again.")
+            await update.message.reply_text(
+                messages.render("invalid_email", self.language(context)),
+                parse_mode=messages.PARSE_MODE,
+            )
             return EMAIL
 
-    async def collect_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def collect_phone(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> int:
         telegram_id = update.message.from_user.id
         context.user_data["phone"] = update.message.text
-        async with httpx.AsyncClient() as client:
-            try:
-                shop_data = {
-                    "nit": context.user_data["nit"],
-                    "name": context.user_data["name"],
-                    "email": context.user_data["email"],
-                    "phone": context.user_data["phone"],
-                    "telegram_id": telegram_id
-                }
-
-                response = await client.post(
-                    f"{BACKEND_URL}/shops/", json=shop_data
+        language = self.language(context)
+        try:
+            shop_data = {
+                "nit": context.user_data["nit"],
+                "name": context.user_data["name"],
+                "email": context.user_data["email"],
+                "phone": context.user_data["phone"],
+                "telegram_id": telegram_id,
+            }
+
+            response = await self.backend.create_shop(shop_data)
+            if response.status_code == 201:
+                shop = response.json().get("shop")
+                # the created event may come later, the shop can redeem right away
+                self.shops.put(shop, telegram_id)
+                await update.message.reply_text(
+                    text=messages.render(
+                        "shop_created",
+                        language,
+                        name=shop["name"],
+                        nit=shop["nit"],
+                        email=shop["email"],
+                        phone=shop["phone"],
+                    ),
+                    parse_mode=messages.PARSE_MODE,
+                    reply_markup=self.get_shop_menu(language),
                 )
-                if response.status_code == 201:
-                    shop = response.json().get('shop')
-                    shop_info = (
-                    f"🏪      Shop created successfully             ✅\n\n"
-                    f"• **Name**: {shop['name']}\n"
-                    f"• **Nit**: `{shop['nit']}`\n"
-                    f"• **Email**: {shop['email']}\n"
-                    f"• **Phone**: {shop['phone']}\n\n\n"
-                    )
-                    await update.message.reply_text(
-                        text=shop_info,
-                        parse_mode="Markdown",
-                        reply_markup=self.get_shop_menu(),
-                    )
-            except Exception as e:
-                context.user_data["conversation_active"] = False
-                await update.message.reply_text(f"Error in shop data:\n{e}\nPlease restart.")
-                return ConversationHandler.END
+        except BackendUnavailable:
+            context.user_data["conversation_active"] = False
+            await update.message.reply_text(
+                messages.render("backend_busy", language),
+                parse_mode=messages.PARSE_MODE,
+            )
+            return ConversationHandler.END
+        except Exception as e:
+            context.user_data["conversation_active"] = False
+            await update.message.reply_text(
+                messages.render("shop_error", language, error=e),
+                parse_mode=messages.PARSE_MODE,
+            )
+            return ConversationHandler.END
 
     # Cancel the conversation
 
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         context.user_data["conversation_active"] = False
         await update.message.reply_text(
-            "Shop creation canceled.", reply_markup=ReplyKeyboardRemove()
+            messages.render("shop_canceled", self.language(context)),
+            parse_mode=messages.PARSE_MODE,
+            reply_markup=ReplyKeyboardRemove(),
         )
         return ConversationHandler.END
 
-
-    def get_shop_menu(self):
-        return InlineKeyboardMarkup([
-            [InlineKeyboardButton("Redeem", callback_data="shop_redeem")],
-        ])
+    def get_shop_menu(self, language: str = messages.DEFAULT_LANGUAGE):
+        return messages.shop_menu(language)
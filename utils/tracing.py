@@ -0,0 +1,239 @@
+import atexit
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# spans go to a JSON lines file, an OTLP/HTTP JSON collector, or nowhere
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+CORRELATION_HEADER = "X-Correlation-ID"
+SERVICE_NAME = "gifty-telegram-bot"
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "sampled",
+        "start",
+        "end",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        sampled: bool,
+        attributes: dict,
+    ):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.sampled = sampled
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class SpanExporter:
+    """Ships finished spans from a background thread.
+
+    ``export`` only puts the span on a bounded queue, spans are dropped when it is
+    full rather than slowing the event loop down.
+    """
+
+    def __init__(
+        self, file: str | None = TRACE_FILE, endpoint: str | None = TRACE_OTLP_ENDPOINT
+    ):
+        self.file = file
+        self.endpoint = endpoint
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread: threading.Thread | None = None
+        if self.enabled:
+            self._thread = threading.Thread(
+                target=self._run, name="span-exporter", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.file or self.endpoint)
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        if self._thread and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            stop = None in batch
+            spans = [span for span in batch if span is not None]
+            if spans:
+                try:
+                    self._write(spans)
+                except Exception as e:
+                    print(f"WARNING:  Could not export {len(spans)} spans: {e}")
+            if stop:
+                return
+
+    def _write(self, spans: list[Span]) -> None:
+        if self.file:
+            with open(self.file, "a") as file:
+                for span in spans:
+                    file.write(json.dumps(span.to_otlp()) + "\n")
+        if self.endpoint:
+            body = {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": {"stringValue": SERVICE_NAME},
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "gifty"},
+                                "spans": [span.to_otlp() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+            request = urllib.request.Request(
+                self.endpoint,
+                data=json.dumps(body).encode(),
+                headers={"Content-Type": "application/json"},
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+
+exporter = SpanExporter()
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def correlation_id() -> str | None:
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def _trace_id_for(correlation: str) -> str:
+    # any caller supplied id maps to a stable, valid trace id
+    if len(correlation) == 32 and all(c in "0123456789abcdef" for c in correlation):
+        return correlation
+    return hashlib.blake2b(correlation.encode(), digest_size=16).hexdigest()
+
+
+@contextmanager
+def start_span(
+    name: str, correlation: str | None = None, parent: Span | None = None, **attributes
+):
+    """Opens a span, child of ``parent`` or of the current span, else a new trace.
+
+    ``correlation`` continues a trace started elsewhere (e.g. an inbound header).
+    """
+    parent = parent or _current.get()
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+    else:
+        trace_id = _trace_id_for(correlation) if correlation else _new_trace_id()
+        if correlation:
+            attributes["correlation_id"] = correlation
+        span = Span(
+            name, trace_id, None, random.random() < TRACE_SAMPLE_RATE, attributes
+        )
+
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        span.end = time.time_ns()
+        if span.sampled and exporter.enabled:
+            exporter.export(span)
+
+
+# spans waiting for work that continues in another task, e.g. a queued update
+_carried: OrderedDict[object, Span] = OrderedDict()
+
+
+def carry(key: object) -> None:
+    span = _current.get()
+    if span is not None:
+        _carried[key] = span
+        while len(_carried) > 10_000:
+            _carried.popitem(last=False)
+
+
+def resume(key: object) -> Span | None:
+    return _carried.pop(key, None)
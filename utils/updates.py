@@ -0,0 +1,100 @@
+import asyncio
+import inspect
+import sys
+from typing import Any, Awaitable
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from utils import metrics, tracing
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping them in order within each chat.
+
+    Updates of the same chat wait on a per-chat lock *before* taking one of the
+    global slots, so a busy chat can not starve the others.
+    """
+
+    # the base class takes a slot before do_process_update, where an update waiting for its
+    # chat would hold it: its semaphore is sized while this is still unbounded, and the
+    # real slots are taken after the chat lock
+    _limit = sys.maxsize
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # chat_id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks: dict[int, list] = {}
+        # tasks processing or waiting to process an update, cancelled past the drain deadline
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    @staticmethod
+    def chat_id(update: object) -> int | None:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    def cancel_pending(self) -> int:
+        """Cancels every update still being processed or waiting, returns how many."""
+        for task in self._tasks:
+            task.cancel()
+        return len(self._tasks)
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            self._tasks.discard(task)
+            if inspect.getcoroutinestate(coroutine) == inspect.CORO_CREATED:
+                # cancelled while waiting for its turn
+                coroutine.close()
+
+    async def _process_in_order(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        chat_id = self.chat_id(update)
+        if chat_id is None:
+            async with self._slots:
+                await self._process(update, coroutine)
+            return
+
+        entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await self._process(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat_id]
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]) -> None:
+        metrics.updates_in_flight.inc()
+        update_id = getattr(update, "update_id", None)
+        # webhook updates continue the trace of the request that delivered them
+        with tracing.start_span(
+            "update",
+            parent=tracing.resume(update_id),
+            update_id=update_id,
+            chat_id=self.chat_id(update),
+        ):
+            try:
+                await coroutine
+            finally:
+                metrics.updates_in_flight.dec()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
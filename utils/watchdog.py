@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+LOOP_WATCHDOG_INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL", "0.25"))
+# a callback holding the loop longer than this gets its stack logged
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))
+
+
+class LoopWatchdog:
+    """Measures event loop lag and logs the stack of whatever blocks the loop.
+
+    A task on the loop wakes every ``interval`` and records how late it woke up. A
+    thread checks that the task keeps waking up, when it has not for ``threshold``
+    seconds the loop is stuck in a callback and the thread prints the loop thread's
+    current stack, which is the code doing the blocking.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_WATCHDOG_INTERVAL,
+        threshold: float = LOOP_STALL_THRESHOLD,
+    ):
+        self.interval = interval
+        self.threshold = max(threshold, interval * 2)
+        self._beat = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: int | None = None
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _measure(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+            metrics.loop_lag.observe(lag)
+            if lag >= self.threshold:
+                metrics.loop_stalls.inc()
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold or beat == reported:
+                continue
+            # one report per stall, however long it lasts
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = (
+                "".join(traceback.format_stack(frame)) if frame else "  (no frame)\n"
+            )
+            print(
+                f"WARNING:  Event loop blocked for over {stalled:.2f}s, loop thread is at:\n{stack}",
+                end="",
+            )